@@ -0,0 +1,110 @@
+"""
+Compare the vectorised track distance computation with the previous per-point loops.
+
+Usage: python benchmarks/bench_distance.py [GPX files...]
+Defaults to the fixtures in tests/gpx.
+"""
+
+from __future__ import annotations
+
+import glob
+import math
+import sys
+import timeit
+from pathlib import Path
+
+import gpxpy
+import numpy as np
+import pandas as pd
+
+from stravavis.process_data import segment_distances
+
+FIXTURES = Path(__file__).parent.parent / "tests" / "gpx"
+
+
+# Previous process_gpx distance loop
+def gpx_loop(points: list[tuple[float, float]]) -> list[float]:
+    dist = []
+    x0, y0 = points[0]
+    d0 = 0
+    for x, y in points:
+        d = d0 + math.sqrt(math.pow(x - x0, 2) + math.pow(y - y0, 2))
+        dist.append(d)
+        x0 = x
+        y0 = y
+        d0 = d
+    return dist
+
+
+# Previous process_fit distance loop, with scalar DataFrame indexing
+def fit_loop(df: pd.DataFrame) -> list[float]:
+    dist = []
+    for i in range(len(df.index)):
+        if i < 1:
+            x0 = df["longitude"][0]
+            y0 = df["latitude"][0]
+            d0 = 0
+            dist.append(d0)
+        else:
+            x = df["longitude"][i]
+            y = df["latitude"][i]
+            d = d0 + math.sqrt(math.pow(x - x0, 2) + math.pow(y - y0, 2))
+            dist.append(d)
+            x0 = x
+            y0 = y
+            d0 = d
+    return dist
+
+
+def load_points(filenames: list[str]) -> list[tuple[float, float]]:
+    points = []
+    for fname in filenames:
+        with open(fname, encoding="utf-8") as f:
+            try:
+                activity = gpxpy.parse(f)
+            except gpxpy.mod_gpx.GPXException:
+                continue
+        for activity_track in activity.tracks:
+            for segment in activity_track.segments:
+                points += [(p.longitude, p.latitude) for p in segment.points]
+    return points
+
+
+def bench(label: str, old, new, number: int) -> None:
+    t_old = min(timeit.repeat(old, number=number, repeat=3)) / number
+    t_new = min(timeit.repeat(new, number=number, repeat=3)) / number
+    print(
+        f"{label:<6} loop {t_old * 1000:8.3f} ms  "
+        f"vectorised {t_new * 1000:8.3f} ms  speedup {t_old / t_new:6.1f}x"
+    )
+
+
+def main() -> None:
+    filenames = sys.argv[1:] or sorted(glob.glob(str(FIXTURES / "*.gpx")))
+    points = load_points(filenames)
+    lon = np.array([p[0] for p in points])
+    lat = np.array([p[1] for p in points])
+    df = pd.DataFrame({"longitude": lon, "latitude": lat})
+    print(f"{len(points)} points from {len(filenames)} files")
+
+    # The vectorised result must match the loop exactly
+    assert np.array_equal(gpx_loop(points), segment_distances(lon, lat))
+    assert np.array_equal(fit_loop(df), segment_distances(lon, lat))
+
+    bench("GPX", lambda: gpx_loop(points), lambda: segment_distances(lon, lat), 20)
+    bench("FIT", lambda: fit_loop(df), lambda: segment_distances(lon, lat), 2)
+    t = (
+        min(
+            timeit.repeat(
+                lambda: segment_distances(lon, lat, None, "haversine"),
+                number=20,
+                repeat=3,
+            )
+        )
+        / 20
+    )
+    print(f"haversine vectorised {t * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
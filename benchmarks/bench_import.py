@@ -0,0 +1,109 @@
+"""
+Check that the stravavis CLI starts quickly and only imports what each run needs.
+
+Usage: python benchmarks/bench_import.py [--budget SECONDS]
+
+Runs the CLI under `python -X importtime` and fails if:
+- `stravavis --help` imports any heavy dependency, or takes longer than the budget
+  to import, or
+- plotting only the map imports the calendar and dumbbell dependencies, or any
+  GUI toolkit.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+FIXTURES = Path(__file__).parent.parent / "tests" / "gpx"
+
+# Never needed to print help or report argument errors
+HEAVY = {
+    "calmap",
+    "fitdecode",
+    "gpxpy",
+    "matplotlib",
+    "numpy",
+    "pandas",
+    "plotnine",
+    "rich",
+}
+
+# Only needed for the calendar and dumbbell plots
+ACTIVITY_PLOTS = {"calmap", "plotnine"}
+
+# GUI toolkits Matplotlib may probe for an interactive backend
+GUI = {"gi", "PyQt5", "PyQt6", "PySide2", "PySide6", "tkinter", "wx"}
+
+
+def import_times(args: list[str], cwd: str | None = None) -> dict[str, int]:
+    # Cumulative import time in microseconds of every module imported while
+    # running the CLI with the given arguments
+    code = (
+        "import sys; from stravavis.cli import main; "
+        f"sys.argv = ['stravavis', *{args!r}]; main()"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+        # Check the backend the CLI picks by itself
+        env={key: value for key, value in os.environ.items() if key != "MPLBACKEND"},
+    )
+    if result.returncode != 0:
+        sys.exit(f"stravavis {' '.join(args)} failed:\n{result.stderr}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        times[name.strip()] = int(cumulative_us)
+    return times
+
+
+def top_level(times: dict[str, int]) -> set[str]:
+    return {name.split(".")[0] for name in times}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.2,
+        help="Maximum import time for stravavis --help, in seconds",
+    )
+    args = parser.parse_args()
+
+    failures = []
+
+    times = import_times(["--help"])
+    total = times["stravavis.cli"] / 1e6
+    print(f"stravavis --help imports in {total * 1000:.1f} ms")
+    heavy = sorted(top_level(times) & HEAVY)
+    if heavy:
+        failures.append(f"stravavis --help imports {', '.join(heavy)}")
+    if total > args.budget:
+        failures.append(f"stravavis --help import took longer than {args.budget} s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        times = import_times([str(FIXTURES), "--plot", "map"], cwd=tmp)
+    print(f"stravavis --plot map imports {len(times)} modules")
+    extra = sorted(top_level(times) & (ACTIVITY_PLOTS | GUI))
+    if extra:
+        failures.append(f"stravavis --plot map imports {', '.join(extra)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
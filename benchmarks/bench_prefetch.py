@@ -0,0 +1,120 @@
+"""
+Compare parsing a cold export with and without threads reading files ahead.
+
+Usage: python benchmarks/bench_prefetch.py [--activities N] [--points M]
+       [--readers R ...] [--workers W] [--repeat N] [--data DIR]
+
+Each run parses every file of a synthetic export in a fresh process, with an empty
+stravavis cache and, where the platform allows, the files evicted from the page
+cache first so they are read from disk. Reader count 0 is the previous behaviour of
+each parsing process reading its own files.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import generate_export
+
+
+def evict(filenames: list[str]) -> bool:
+    # Drop the files from the page cache, if supported
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for fpath in filenames:
+        fd = os.open(fpath, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def run(filenames: list[str], readers: int, workers: int | None) -> float:
+    # Parse the files in this process and return the wall time in seconds
+    from stravavis.process_data import load_tracks
+
+    start = time.perf_counter()
+    load_tracks(filenames, processes=workers, readers=readers)
+    return time.perf_counter() - start
+
+
+def measure(data_dir: Path, readers: int, workers: int | None) -> float:
+    # Parse the export cold in a fresh process with an empty cache
+    filenames = sorted(glob.glob(str(data_dir / "activities" / "*")))
+    evict(filenames)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        command = [
+            sys.executable,
+            __file__,
+            "--data",
+            str(data_dir),
+            "--run",
+            str(readers),
+        ]
+        if workers:
+            command += ["--workers", str(workers)]
+        result = subprocess.run(
+            command,
+            env={**os.environ, "TMPDIR": cache_dir, "TEMP": cache_dir},
+            capture_output=True,
+            text=True,
+        )
+    if result.returncode != 0:
+        sys.exit(f"Run with {readers} readers failed:\n{result.stderr}")
+    return json.loads(result.stdout.splitlines()[-1])["seconds"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--activities", type=int, default=500)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--readers", type=int, nargs="+", default=[0, 8])
+    parser.add_argument("--workers", type=int, help="Parsing processes")
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs per reader count; the fastest is kept",
+    )
+    parser.add_argument("--data", help="Reuse or keep the synthetic export here")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        # Inside the process measuring a single run
+        filenames = sorted(glob.glob(str(Path(args.data) / "activities" / "*")))
+        seconds = run(filenames, args.run, args.workers)
+        print(json.dumps({"seconds": seconds}))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(args.data) if args.data else Path(tmp) / "export"
+        if not (data_dir / "activities.csv").exists():
+            print(f"Generating {args.activities} activities of {args.points} points...")
+            generate_export(data_dir, args.activities, args.points)
+        filenames = glob.glob(str(data_dir / "activities" / "*"))
+        if not evict(filenames):
+            print("Warning: cannot evict files from the page cache on this platform")
+
+        baseline = None
+        print(f"{'readers':>8} {'seconds':>10} {'speedup':>8}")
+        for readers in args.readers:
+            seconds = min(
+                measure(data_dir, readers, args.workers) for _ in range(args.repeat)
+            )
+            baseline = baseline or seconds
+            print(f"{readers:>8} {seconds:>10.3f} {baseline / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
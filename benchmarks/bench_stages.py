@@ -0,0 +1,226 @@
+"""
+Time each stage of stravavis on a synthetic export and record a JSON report.
+
+Usage: python benchmarks/bench_stages.py [--activities N] [--points M]
+       [--stages STAGE ...] [--repeat R] [--output report.json]
+       [--compare baseline.json] [--tolerance FRACTION]
+
+Each stage runs in a fresh process, with the stravavis cache in a private temporary
+directory, and reports its wall time and the peak resident memory of the process
+(including any worker processes). With --compare, stages that got slower or use more
+memory than the baseline by more than the tolerance fail the run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.metadata import version
+from pathlib import Path
+
+from synthetic import generate_export
+
+from stravavis.profiling import peak_rss_mb
+
+STAGES = [
+    "process_file_gpx",
+    "process_file_fit",
+    "process_data_cold",
+    "process_data_warm",
+    "process_activities_cold",
+    "process_activities_warm",
+    "plot_facets",
+    "plot_map",
+    "plot_elevations",
+    "plot_landscape",
+    "plot_calendar",
+    "plot_dumbbell",
+]
+
+# Files parsed one by one by the process_file stages
+PROCESS_FILE_LIMIT = 50
+
+
+def run_stage(stage: str, data_dir: Path, output_dir: Path) -> float:
+    # Run one stage in this process and return its wall time in seconds
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    filenames = sorted(glob.glob(str(data_dir / "activities" / "*")))
+    activities_csv = str(data_dir / "activities.csv")
+
+    if stage.startswith("process_file"):
+        from stravavis.process_data import process_file
+
+        suffix = "." + stage.rsplit("_", 1)[1]
+        files = [f for f in filenames if f.endswith(suffix)][:PROCESS_FILE_LIMIT]
+        start = time.perf_counter()
+        for fpath in files:
+            process_file(fpath)
+        return time.perf_counter() - start
+
+    if stage.startswith("process_data"):
+        from stravavis.process_data import process_data
+
+        start = time.perf_counter()
+        process_data(filenames)
+        return time.perf_counter() - start
+
+    from stravavis.process_activities import process_activities
+
+    if stage.startswith("process_activities"):
+        start = time.perf_counter()
+        process_activities(activities_csv)
+        return time.perf_counter() - start
+
+    import importlib
+
+    module = importlib.import_module(f"stravavis.{stage}")
+    plot = getattr(module, stage)
+    output_file = str(output_dir / f"{stage}.png")
+    if stage in ("plot_calendar", "plot_dumbbell"):
+        data = process_activities(activities_csv)
+    else:
+        from stravavis.process_data import load_tracks
+
+        data = load_tracks(filenames)
+    start = time.perf_counter()
+    plot(data, output_file=output_file)
+    return time.perf_counter() - start
+
+
+def measure(stage: str, data_dir: Path, cache_dir: Path, output_dir: Path) -> dict:
+    # Run a stage in a fresh process, with the stravavis cache in cache_dir
+    if stage == "process_data_cold":
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    elif stage == "process_activities_cold":
+        shutil.rmtree(cache_dir / "stravavis" / "activities", ignore_errors=True)
+    cache_dir.mkdir(exist_ok=True)
+    result = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--run_stage",
+            stage,
+            "--data",
+            str(data_dir),
+            "--plots",
+            str(output_dir),
+        ],
+        env={**os.environ, "TMPDIR": str(cache_dir), "TEMP": str(cache_dir)},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"Stage {stage} failed:\n{result.stderr}")
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    failures = []
+    print(f"\n{'stage':<20} {'baseline':>12} {'now':>12} {'ratio':>7}")
+    for stage, result in report["stages"].items():
+        old = baseline["stages"].get(stage)
+        if old is None:
+            continue
+        for metric, unit in (("seconds", "s"), ("peak_rss_mb", "MB")):
+            if result[metric] is None or old[metric] is None:
+                continue
+            ratio = result[metric] / old[metric] if old[metric] else 1
+            print(
+                f"{stage:<20} {old[metric]:>9.2f} {unit:<2} "
+                f"{result[metric]:>9.2f} {unit:<2} {ratio:>6.2f}x"
+            )
+            if ratio > 1 + tolerance:
+                failures.append(f"{stage} {metric} regressed {ratio:.2f}x")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--activities", type=int, default=200)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Runs per stage; the fastest is kept"
+    )
+    parser.add_argument("--data", help="Reuse or keep the synthetic export here")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown or memory growth relative to the baseline",
+    )
+    parser.add_argument("--run_stage", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--plots", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        # Inside the process measuring a single stage
+        seconds = run_stage(args.run_stage, Path(args.data), Path(args.plots))
+        print(json.dumps({"seconds": seconds, "peak_rss_mb": peak_rss_mb()}))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        data_dir = Path(args.data) if args.data else tmp / "export"
+        if not (data_dir / "activities.csv").exists():
+            print(f"Generating {args.activities} activities of {args.points} points...")
+            generate_export(data_dir, args.activities, args.points)
+        (tmp / "plots").mkdir()
+
+        stages = {}
+        for stage in args.stages:
+            runs = [
+                measure(stage, data_dir, tmp / "cache", tmp / "plots")
+                for _ in range(args.repeat)
+            ]
+            peaks = [run["peak_rss_mb"] for run in runs if run["peak_rss_mb"]]
+            stages[stage] = {
+                "seconds": min(run["seconds"] for run in runs),
+                "peak_rss_mb": max(peaks) if peaks else None,
+            }
+            peak = stages[stage]["peak_rss_mb"]
+            print(
+                f"{stage:<20} {stages[stage]['seconds']:8.3f} s"
+                + (f" {peak:8.1f} MB" if peak else "")
+            )
+
+    report = {
+        "config": {"activities": args.activities, "points": args.points},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stravavis": version("stravavis"),
+            "numpy": version("numpy"),
+            "pandas": version("pandas"),
+            "matplotlib": version("matplotlib"),
+        },
+        "stages": stages,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("Warning: the baseline was run with a different configuration")
+        failures = compare(report, baseline, args.tolerance)
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Generate a synthetic Strava bulk export: N activities of M points each, as GPX and FIT
+files under activities/, plus a matching activities.csv.
+
+Usage: python benchmarks/synthetic.py OUTPUT_DIR [--activities N] [--points M]
+       [--fit_share FRACTION] [--seed SEED]
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import struct
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+FIXTURES = Path(__file__).parent.parent / "tests"
+
+# Activities start near one of these (lon, lat) points, so tracks overlap like
+# a real export
+CENTRES = [(-1.29, 51.40), (2.35, 48.86), (24.94, 60.17), (-122.27, 37.87)]
+
+# Seconds between the Unix epoch and the FIT epoch
+FIT_UTC_REFERENCE = 631065600
+
+# CRC-16 of FIT file headers and data
+CRC_TABLE = [
+    0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+    0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400,
+]  # fmt: skip
+
+
+def fit_crc(data: bytes, crc: int = 0) -> int:
+    for byte in data:
+        tmp = CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ CRC_TABLE[byte & 0xF]
+        tmp = CRC_TABLE[crc & 0xF]
+        crc = (crc >> 4) & 0x0FFF
+        crc = crc ^ tmp ^ CRC_TABLE[(byte >> 4) & 0xF]
+    return crc
+
+
+def csv_date(dt: datetime) -> str:
+    # As in activities.csv, for example "Jun 2, 2023, 11:48:52 AM"
+    return f"{dt:%b} {dt.day}, {dt:%Y}, {dt.hour % 12 or 12}:{dt:%M:%S %p}"
+
+
+def random_track(
+    rng: np.random.Generator, n_points: int, start: datetime
+) -> dict[str, np.ndarray]:
+    # A smooth random walk of about 5 m per second
+    lon0, lat0 = CENTRES[rng.integers(len(CENTRES))]
+    heading = np.cumsum(rng.normal(0, 0.1, n_points)) + rng.uniform(0, 2 * np.pi)
+    step = 5 / 111_000
+    lat = lat0 + rng.normal(0, 0.02) + np.cumsum(step * np.sin(heading))
+    lon = (
+        lon0
+        + rng.normal(0, 0.02)
+        + np.cumsum(step * np.cos(heading) / np.cos(np.radians(lat0)))
+    )
+    ele = 100 + np.cumsum(rng.normal(0, 0.3, n_points))
+    time = int(start.timestamp()) + np.arange(n_points)
+    return {"lon": lon, "lat": lat, "ele": ele, "time": time}
+
+
+def write_gpx(path: Path, track: dict[str, np.ndarray], name: str) -> None:
+    points = "".join(
+        f'<trkpt lat="{lat:.9f}" lon="{lon:.9f}"><ele>{ele:.1f}</ele>'
+        f"<time>{datetime.fromtimestamp(t, timezone.utc):%Y-%m-%dT%H:%M:%SZ}</time>"
+        "</trkpt>\n"
+        for lon, lat, ele, t in zip(
+            track["lon"], track["lat"], track["ele"], track["time"].tolist()
+        )
+    )
+    path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="stravavis benchmarks" '
+        'xmlns="http://www.topografix.com/GPX/1/1">\n'
+        f"<trk><name>{name}</name><trkseg>\n{points}</trkseg></trk></gpx>\n",
+        encoding="utf-8",
+    )
+
+
+def write_fit(path: Path, track: dict[str, np.ndarray]) -> None:
+    # file_id and record messages only, little-endian
+    ts = (track["time"] - FIT_UTC_REFERENCE).astype("<u4")
+    body = struct.pack("<BBBHB", 0x40, 0, 0, 0, 2) + bytes([0, 1, 0, 4, 4, 0x86])
+    body += struct.pack("<BBI", 0, 4, int(ts[0]))
+
+    # Record definition: timestamp, position_lat, position_long, altitude
+    fields = [(253, 4, 0x86), (0, 4, 0x85), (1, 4, 0x85), (2, 2, 0x84)]
+    body += struct.pack("<BBBHB", 0x41, 0, 0, 20, len(fields))
+    body += b"".join(bytes(field) for field in fields)
+    records = np.zeros(
+        len(ts),
+        dtype=[("header", "u1"), ("ts", "<u4"), ("lat", "<i4"), ("lon", "<i4"),
+               ("alt", "<u2")],
+    )  # fmt: skip
+    records["header"] = 1
+    records["ts"] = ts
+    records["lat"] = np.round(track["lat"] * 2**32 / 360)
+    records["lon"] = np.round(track["lon"] * 2**32 / 360)
+    records["alt"] = np.round((track["ele"] + 500) * 5)
+    body += records.tobytes()
+
+    header = struct.pack("<BBHI4s", 14, 0x20, 2132, len(body), b".FIT")
+    header += struct.pack("<H", fit_crc(header))
+    data = header + body
+    path.write_bytes(data + struct.pack("<H", fit_crc(data)))
+
+
+def generate_export(
+    output_dir: str | Path,
+    n_activities: int,
+    n_points: int,
+    fit_share: float = 0.5,
+    seed: int = 0,
+) -> Path:
+    # Write activities/<id>.gpx or .fit and activities.csv, and return the
+    # activities directory
+    rng = np.random.default_rng(seed)
+    output_dir = Path(output_dir)
+    activities_dir = output_dir / "activities"
+    activities_dir.mkdir(parents=True, exist_ok=True)
+
+    # Use the column layout of a real activities.csv
+    with open(FIXTURES / "csv" / "activities.csv", encoding="utf-8") as f:
+        header = next(csv.reader(f))
+    columns = {}
+    for i, column in enumerate(header):
+        columns.setdefault(column, []).append(i)
+
+    first = datetime(2015, 1, 1, tzinfo=timezone.utc).timestamp()
+    last = datetime(2024, 12, 31, tzinfo=timezone.utc).timestamp()
+    starts = np.sort(rng.uniform(first, last, n_activities))
+
+    with open(output_dir / "activities.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i, start in enumerate(starts):
+            activity_id = 1_000_000 + i
+            start = datetime.fromtimestamp(int(start), timezone.utc)
+            track = random_track(rng, n_points, start)
+            if rng.random() < fit_share:
+                filename = f"activities/{activity_id}.fit"
+                write_fit(output_dir / filename, track)
+            else:
+                filename = f"activities/{activity_id}.gpx"
+                write_gpx(output_dir / filename, track, f"Activity {activity_id}")
+
+            distance = n_points * 5
+            row = [""] * len(header)
+            values = {
+                "Activity ID": [activity_id],
+                "Activity Date": [csv_date(start)],
+                "Activity Name": [f"Activity {activity_id}"],
+                "Activity Type": ["Ride"],
+                # Seconds, then again; kilometres, then metres
+                "Elapsed Time": [n_points - 1, n_points - 1],
+                "Moving Time": [n_points - 1],
+                "Distance": [distance / 1000, distance],
+                "Filename": [filename],
+            }
+            for column, column_values in values.items():
+                for index, value in zip(columns[column], column_values):
+                    row[index] = value
+            writer.writerow(row)
+
+    return activities_dir
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("output_dir")
+    parser.add_argument("--activities", type=int, default=100)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--fit_share", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_export(
+        args.output_dir, args.activities, args.points, args.fit_share, args.seed
+    )
+
+
+if __name__ == "__main__":
+    main()
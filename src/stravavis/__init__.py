@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+__all__ = ["Dataset"]
+
+
+def __getattr__(name: str):
+    # Imported on first use, so the CLI starts without numpy and pandas
+    if name == "Dataset":
+        from .dataset import Dataset
+
+        return Dataset
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import pandas as pd
+
+from .dataset import Dataset
+from .process_activities import parse_activity_dates
+
+
+def _hours(times: pd.Series) -> pd.Series:
+    # Time of day in fractional hours
+    return (times - times.dt.normalize()) / pd.Timedelta(hours=1)
+
+
+class ActivityTimes:
+    # Local start and end time of each activity, with its year, day of year and
+    # start and end time of day in fractional hours, plus the total distance of
+    # each day. Built once from activities.csv and shared by the calendar and
+    # dumbbell plots, which never modify it.
+
+    def __init__(self, activities: pd.DataFrame, local_timezone: str | None = None):
+        self.local_timezone = local_timezone
+
+        start = activities["Activity Date"]
+        if not pd.api.types.is_datetime64_any_dtype(start):
+            start = parse_activity_dates(start)
+
+        # Activity dates are in UTC; convert them to naive local times
+        if local_timezone:
+            start = (
+                start.dt.tz_localize(tz="UTC", nonexistent="NaT", ambiguous="NaT")
+                .dt.tz_convert(local_timezone)
+                .dt.tz_localize(None)
+            )
+        end = start + pd.to_timedelta(activities["Elapsed Time"], unit="s")
+
+        self.table = pd.DataFrame(
+            {
+                "start": start,
+                "end": end,
+                "year": start.dt.year,
+                "dayofyear": start.dt.dayofyear,
+                "x": _hours(start),
+                "xend": _hours(end),
+            }
+        )
+        self.daily_distance = (
+            activities["Distance"].groupby(start.dt.normalize().rename("date")).sum()
+        )
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+def activity_times(
+    activities: pd.DataFrame | ActivityTimes | Dataset,
+    local_timezone: str | None = None,
+) -> ActivityTimes:
+    # The index of the activities. Built afresh for a DataFrame, which may have
+    # changed since the last call; a Dataset shares it between plots.
+    if isinstance(activities, Dataset):
+        return activities.activity_times(local_timezone)
+    if isinstance(activities, ActivityTimes):
+        if activities.local_timezone != local_timezone:
+            msg = (
+                f"Activity times are in {activities.local_timezone or 'UTC'}, "
+                f"not {local_timezone or 'UTC'}"
+            )
+            raise ValueError(msg)
+        return activities
+    return ActivityTimes(activities, local_timezone)
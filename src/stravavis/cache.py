@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from .sources import source_exists, source_identity
+
+# Bump whenever the columns or dtypes returned by process_file change,
+# so stale entries are never mixed with freshly parsed ones
+SCHEMA_VERSION = 4
+
+# Upper bound for the per-file cache; least recently used entries go first
+MAX_CACHE_BYTES = 2 * 1024**3
+
+# Number of assembled track stores kept, one per distinct set of input files
+MAX_STORES = 3
+
+CACHE_DIR = Path(tempfile.gettempdir()) / "stravavis"
+
+
+def file_key(fpath: str, *options: str) -> str:
+    # Key on the identity of the source file (path, size and modification time,
+    # or CRC for archive members), plus any options that change the parsed result
+    ident = f"{SCHEMA_VERSION}\0{source_identity(fpath)}\0" + "\0".join(options)
+    return hashlib.md5(ident.encode("utf-8")).hexdigest()
+
+
+class TrackCache:
+    # Persistent cache of parsed tracks, one pickle of typed columns per source
+    # file, and a quarantine list of the files that failed to parse, with the
+    # reason, so they are skipped until they change
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.dir = Path(cache_dir) / "tracks"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.index_path = self.dir / "index.json"
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {}
+        self.quarantine_path = self.dir / "quarantine.json"
+        try:
+            with open(self.quarantine_path, encoding="utf-8") as f:
+                self.quarantine = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.quarantine = {}
+
+    def _entry_path(self, key: str) -> Path:
+        return self.dir / f"{key}.pkl"
+
+    def get(self, key: str) -> tuple[bool, dict[str, np.ndarray] | None]:
+        entry = self._entry_path(key)
+        try:
+            with open(entry, "rb") as f:
+                columns = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return False, None
+
+        # Touch the entry so LRU cleanup keeps recently used tracks
+        os.utime(entry)
+        return True, columns
+
+    def failure(self, fpath: str, key: str) -> str | None:
+        # Why this version of the file failed to parse, if it did
+        entry = self.quarantine.get(os.path.abspath(fpath))
+        if entry is not None and entry["key"] == key:
+            return entry["reason"]
+        return None
+
+    def put(
+        self,
+        fpath: str,
+        key: str,
+        columns: dict[str, np.ndarray] | None,
+        reason: str | None = None,
+    ) -> None:
+        # Failed parses (columns None) are quarantined so they aren't retried
+        # every run
+        path = os.path.abspath(fpath)
+        if columns is None:
+            self.quarantine[path] = {"key": key, "reason": reason or "Failed"}
+            return
+        self.quarantine.pop(path, None)
+
+        tmp = self._entry_path(key).with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(columns, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._entry_path(key))
+
+        # Drop the entry for a previous version of the same file
+        old_key = self.index.get(os.path.abspath(fpath))
+        if old_key and old_key != key:
+            self._entry_path(old_key).unlink(missing_ok=True)
+        self.index[os.path.abspath(fpath)] = key
+
+    def prune(self) -> None:
+        # Evict entries for source files that no longer exist
+        self.quarantine = {
+            path: entry
+            for path, entry in self.quarantine.items()
+            if source_exists(path)
+        }
+        for path, key in list(self.index.items()):
+            if not source_exists(path):
+                self._entry_path(key).unlink(missing_ok=True)
+                del self.index[path]
+
+        # Enforce the size bound, evicting least recently used entries first
+        entries = []
+        for entry in self.dir.glob("*.pkl"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        live = set(self.index.values())
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            live.discard(entry.stem)
+            total -= size
+        self.index = {path: key for path, key in self.index.items() if key in live}
+
+        self.save()
+
+    def save(self) -> None:
+        for path, index in (
+            (self.index_path, self.index),
+            (self.quarantine_path, self.quarantine),
+        ):
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp, path)
+
+
+def store_dir(keys: dict[str, str], cache_dir: Path = CACHE_DIR) -> Path:
+    # Key the assembled store on the names and per-file keys of its inputs
+    ident = "\0".join(f"{fpath}\0{key}" for fpath, key in keys.items())
+    key = hashlib.md5(ident.encode("utf-8")).hexdigest()
+    return Path(cache_dir) / "stores" / key
+
+
+def prune_stores(cache_dir: Path = CACHE_DIR, keep: int = MAX_STORES) -> None:
+    stores = [p for p in (Path(cache_dir) / "stores").glob("*") if p.is_dir()]
+    stores.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in stores[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class RenderCache:
+    # Fingerprint of the data and arguments each output was rendered from, so
+    # outputs that are still up to date are not rendered again
+
+    def __init__(self, cache_dir: Path = CACHE_DIR):
+        self.path = Path(cache_dir) / "renders.json"
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {}
+
+    def fresh(self, output: str, fingerprint: str) -> bool:
+        # Whether the output exists, unmodified, rendered with this fingerprint
+        entry = self.index.get(os.path.abspath(output))
+        return (
+            entry is not None
+            and entry["fingerprint"] == fingerprint
+            and entry["stat"] == _output_stat(output)
+        )
+
+    def put(self, output: str, fingerprint: str) -> None:
+        # Also forget outputs that have since been removed
+        self.index = {path: e for path, e in self.index.items() if os.path.exists(path)}
+        self.index[os.path.abspath(output)] = {
+            "fingerprint": fingerprint,
+            "stat": _output_stat(output),
+        }
+        tmp = self.path.with_suffix(".tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.path)
+
+
+def _output_stat(output: str) -> list[int] | None:
+    # Size and modification time of an output file or directory
+    try:
+        stat = os.stat(output)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
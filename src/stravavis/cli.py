@@ -4,6 +4,12 @@ import argparse
 import glob
 import os.path
 import sys
+import zipfile
+from functools import partial
+
+# Visualisations of the tracks, and of activities.csv
+TRACK_PLOTS = {"elevations", "facets", "landscape", "map"}
+ACTIVITY_PLOTS = {"calendar", "dumbbell"}
 
 VISUALISATIONS = {
     "all",
@@ -21,7 +27,9 @@ def main():
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
     parser.add_argument(
-        "path", help="Input path specification to folder with GPX and / or FIT files"
+        "path",
+        help="Input path specification to folder with GPX and / or FIT files, "
+        "or to the Strava bulk export zip",
     )
     parser.add_argument(
         "--plot",
@@ -33,6 +41,13 @@ def main():
     parser.add_argument(
         "-o", "--output_prefix", default="strava", help="Prefix for output PNG files"
     )
+    parser.add_argument(
+        "--distance",
+        default="planar",
+        choices=["planar", "haversine"],
+        help="How to measure distance along tracks: planar degrees or haversine "
+        "metres",
+    )
     parser.add_argument(
         "--lon_min",
         type=float,
@@ -62,10 +77,113 @@ def main():
     )
     parser.add_argument(
         "--alpha",
+        type=float,
         default=0.4,
         help="Line transparency. 0 = Fully transparent, 1 = No transparency",
     )
-    parser.add_argument("--linewidth", default=0.4, help="Line width")
+    parser.add_argument("--linewidth", type=float, default=0.4, help="Line width")
+    parser.add_argument(
+        "--simplify",
+        default=True,
+        action=argparse.BooleanOptionalAction,
+        help="Simplify tracks to the output resolution before plotting "
+        "facets, map, elevations and landscape",
+    )
+    parser.add_argument(
+        "--render",
+        default="vector",
+        choices=["vector", "raster", "tiles"],
+        help="How to draw the map: vector lines, a raster density heatmap that "
+        "scales to very many activities, or a directory of slippy map tiles",
+    )
+    parser.add_argument(
+        "--tone",
+        default="log",
+        choices=["log", "equalize"],
+        help="Tone mapping of track density for --render raster",
+    )
+    parser.add_argument(
+        "--zoom_min", type=int, default=0, help="Lowest zoom level for --render tiles"
+    )
+    parser.add_argument(
+        "--zoom_max", type=int, default=14, help="Highest zoom level for --render tiles"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Number of processes parsing files (0 for one per CPU)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=0,
+        help="Number of files each parsing process handles at a time "
+        "(0 to base it on the number of files and processes)",
+    )
+    parser.add_argument(
+        "--readers",
+        type=int,
+        default=8,
+        help="Number of threads reading files ahead of the parsing processes "
+        "(0 to read files in the parsing processes)",
+    )
+    parser.add_argument(
+        "--file_timeout",
+        type=float,
+        default=120,
+        help="Seconds a single file may take to parse before it is quarantined "
+        "(0 for no limit; not enforced on Windows)",
+    )
+    parser.add_argument(
+        "--file_memory",
+        type=int,
+        default=2048,
+        help="Megabytes a single file may use while parsing before it is "
+        "quarantined (0 for no limit; only enforced on Linux)",
+    )
+    parser.add_argument(
+        "--retry_failed",
+        action="store_true",
+        help="Parse files quarantined by earlier runs again",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Exit with an error if any input file fails to parse or has no points",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of visualisations to render in parallel",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render every visualisation, even those whose output is up to date "
+        "with the data and options",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        nargs="?",
+        const=60,
+        metavar="SECONDS",
+        help="Keep running, checking the input every SECONDS, or every 60 if "
+        "SECONDS is omitted, for new or changed files, and update the affected "
+        "visualisations",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="TRACE_FILE",
+        help="Print the time and memory used by each stage, and save them as "
+        "Chrome trace events to TRACE_FILE, or OUTPUT_PREFIX-profile.json if "
+        "TRACE_FILE is omitted",
+    )
     parser.add_argument(
         "--activities_path", help="Path to activities.csv from Strava bulk export zip"
     )
@@ -108,12 +226,23 @@ def main():
     # Expand "~" or "~user"
     args.path = os.path.expanduser(args.path)
 
-    if os.path.isdir(args.path):
-        args.path = os.path.join(args.path, "*")
+    if os.path.isfile(args.path) and zipfile.is_zipfile(args.path):
+        from .sources import source_exists
+
+        # Read tracks and activities.csv straight from the bulk export zip
+        filenames = _input_files(args.path)
+        if not filenames:
+            sys.exit(f"No GPX or FIT files found in {args.path}")
+        activities_csv = os.path.join(args.path, "activities.csv")
+        if not args.activities_path and source_exists(activities_csv):
+            args.activities_path = activities_csv
+    else:
+        if os.path.isdir(args.path):
+            args.path = os.path.join(args.path, "*")
 
-    filenames = sorted(glob.glob(args.path))
-    if not filenames:
-        sys.exit(f"No files found matching {args.path}")
+        filenames = _input_files(args.path)
+        if not filenames:
+            sys.exit(f"No files found matching {args.path}")
 
     if args.bbox:
         try:
@@ -130,15 +259,46 @@ def main():
                 "or a file containing them"
             )
 
+    if args.jobs < 1:
+        sys.exit("--jobs must be at least 1")
+    if args.watch is not None and args.watch <= 0:
+        sys.exit("--watch interval must be positive")
+    for option in ("workers", "chunksize", "readers", "file_timeout", "file_memory"):
+        if getattr(args, option) < 0:
+            sys.exit(f"--{option} must not be negative")
+
+    if not 0 <= args.zoom_min <= args.zoom_max:
+        sys.exit("Zoom levels must satisfy 0 <= zoom_min <= zoom_max")
+
     if args.activities_path and os.path.isdir(args.activities_path):
         args.activities_path = os.path.join(args.activities_path, "activities.csv")
 
+    # Plots are only ever saved to files, so skip Matplotlib's GUI backend probing
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+    from .profiling import profiler
+
+    profiler.enabled = args.profile is not None
+
     # Normally imports go at the top, but scientific libraries can be slow to import
     # so let's validate arguments first
-    from .process_data import process_data
+    with profiler.stage("import"):
+        from .dataset import Dataset
+        from .process_data import load_tracks
 
     print("Processing data...")
-    df = process_data(filenames)
+    df = load_tracks(
+        filenames,
+        args.distance,
+        args.workers or None,
+        args.chunksize or None,
+        readers=args.readers,
+        timeout=args.file_timeout,
+        memory=args.file_memory * 1024**2,
+        retry_failed=args.retry_failed,
+    )
+    if args.strict and len(df) < len(filenames):
+        sys.exit(f"{len(filenames) - len(df)} of {len(filenames)} files have no data")
     if df.empty:
         sys.exit("No data to plot")
 
@@ -147,86 +307,283 @@ def main():
         from .process_activities import process_activities
 
         print("Processing activities...")
-        activities = process_activities(args.activities_path)
+        with profiler.stage("process activities") as counts:
+            activities = process_activities(args.activities_path)
+            counts["activities"] = len(activities)
 
-    if "facets" in args.plot:
-        from .plot_facets import plot_facets
+    # Views derived from the data are shared by the plots. Local activity times
+    # are built up front so they also reach plots run in other processes.
+    data = Dataset(df, activities)
+    if activities is not None and {"calendar", "dumbbell"} & set(args.plot):
+        with profiler.stage("activity times", activities=len(activities)):
+            data.activity_times(args.local_timezone)
+
+    _render(_plots(args, data), args.jobs, args.force)
+
+    if profiler.enabled:
+        profiler.summary()
+        trace_file = args.profile or f"{args.output_prefix}-profile.json"
+        profiler.save(trace_file)
+        print(f"Saved profile to {trace_file}")
+
+    if args.watch:
+        _watch(args, data)
 
-        print("Plotting facets...")
+
+def _input_files(path: str) -> list[str]:
+    # Track files in a bulk export zip, or track files matching a glob pattern
+    from .sources import list_archive, track_format
+
+    if os.path.isfile(path) and zipfile.is_zipfile(path):
+        return list_archive(path)
+    return sorted(fpath for fpath in glob.glob(path) if track_format(fpath))
+
+
+def _plots(args, data) -> list[tuple[str, tuple, dict]]:
+    # Each visualisation is plot_<name>(*args, **kwargs) in module plot_<name>
+    plots = []
+    if "facets" in args.plot:
         outfile = f"{args.output_prefix}-facets.png"
-        plot_facets(df, output_file=outfile)
-        print(f"Saved to {outfile}")
+        plots.append(
+            ("facets", (data,), {"output_file": outfile, "simplify": args.simplify})
+        )
 
     if "map" in args.plot:
-        from .plot_map import plot_map
-
-        print("Plotting map...")
-        outfile = f"{args.output_prefix}-map.png"
-        plot_map(
-            df,
-            args.lon_min,
-            args.lon_max,
-            args.lat_min,
-            args.lat_max,
-            args.alpha,
-            args.linewidth,
-            outfile,
+        if args.render == "tiles":
+            outfile = f"{args.output_prefix}-tiles"
+        else:
+            outfile = f"{args.output_prefix}-map.png"
+        plots.append(
+            (
+                "map",
+                (data, args.lon_min, args.lon_max, args.lat_min, args.lat_max),
+                {
+                    "alpha": args.alpha,
+                    "linewidth": args.linewidth,
+                    "output_file": outfile,
+                    "simplify": args.simplify,
+                    "render": args.render,
+                    "tone": args.tone,
+                    "processes": None,
+                    "zoom_min": args.zoom_min,
+                    "zoom_max": args.zoom_max,
+                },
+            )
         )
-        print(f"Saved to {outfile}")
 
     if "elevations" in args.plot:
-        from .plot_elevations import plot_elevations
-
-        print("Plotting elevations...")
         outfile = f"{args.output_prefix}-elevations.png"
-        plot_elevations(df, output_file=outfile)
-        print(f"Saved to {outfile}")
+        plots.append(
+            ("elevations", (data,), {"output_file": outfile, "simplify": args.simplify})
+        )
 
     if "landscape" in args.plot:
-        from .plot_landscape import plot_landscape
-
-        print("Plotting landscape...")
         outfile = f"{args.output_prefix}-landscape.png"
-        plot_landscape(df, output_file=outfile)
-        print(f"Saved to {outfile}")
+        plots.append(
+            ("landscape", (data,), {"output_file": outfile, "simplify": args.simplify})
+        )
 
-    if activities is not None:
+    if data.activities is not None:
         if "calendar" in args.plot:
-            from .plot_calendar import plot_calendar
-
-            print("Plotting calendar...")
             outfile = f"{args.output_prefix}-calendar.png"
-            fig_height = args.fig_height or 15
-            fig_width = args.fig_width or 9
-            plot_calendar(
-                activities,
-                args.year_min,
-                args.year_max,
-                args.max_dist,
-                fig_height,
-                fig_width,
-                outfile,
+            plots.append(
+                (
+                    "calendar",
+                    (data, args.year_min, args.year_max, args.max_dist),
+                    {
+                        "fig_height": args.fig_height or 15,
+                        "fig_width": args.fig_width or 9,
+                        "output_file": outfile,
+                        "local_timezone": args.local_timezone,
+                    },
+                )
             )
-            print(f"Saved to {outfile}")
 
         if "dumbbell" in args.plot:
-            from .plot_dumbbell import plot_dumbbell
-
-            print("Plotting dumbbell...")
             outfile = f"{args.output_prefix}-dumbbell.png"
-            fig_height = args.fig_height or 34
-            fig_width = args.fig_width or 34
-            plot_dumbbell(
-                activities,
-                args.year_min,
-                args.year_max,
-                args.local_timezone,
-                fig_height,
-                fig_width,
-                outfile,
+            plots.append(
+                (
+                    "dumbbell",
+                    (data, args.year_min, args.year_max, args.local_timezone),
+                    {
+                        "fig_height": args.fig_height or 34,
+                        "fig_width": args.fig_width or 34,
+                        "output_file": outfile,
+                    },
+                )
             )
+
+    return plots
+
+
+def _fingerprint(plot: tuple[str, tuple, dict]) -> str:
+    # Digest of what a plot's output depends on: the data it uses (for the map,
+    # only the activities within its bounds), its other arguments and the
+    # version of stravavis
+    import hashlib
+    from importlib.metadata import PackageNotFoundError, version
+
+    name, args, kwargs = plot
+    data = args[0]
+    if name in ACTIVITY_PLOTS:
+        data_fingerprint = data.activities_fingerprint()
+    elif name == "map":
+        data_fingerprint = data.tracks_fingerprint(*args[1:5])
+    else:
+        data_fingerprint = data.tracks_fingerprint()
+    try:
+        package = version("stravavis")
+    except PackageNotFoundError:
+        package = ""
+    options = {
+        key: value
+        for key, value in kwargs.items()
+        if key not in ("output_file", "processes")
+    }
+    ident = repr((name, package, data_fingerprint, args[1:], sorted(options.items())))
+    return hashlib.md5(ident.encode("utf-8")).hexdigest()
+
+
+def _render(
+    plots: list[tuple[str, tuple, dict]], jobs: int = 1, force: bool = False
+) -> None:
+    from .cache import RenderCache
+    from .profiling import profiler
+
+    # Skip outputs already rendered from the same data and options
+    cache = RenderCache()
+    fingerprints = {plot[2]["output_file"]: _fingerprint(plot) for plot in plots}
+    if not force:
+        stale = []
+        for plot in plots:
+            outfile = plot[2]["output_file"]
+            if cache.fresh(outfile, fingerprints[outfile]):
+                print(f"{outfile} is up to date")
+            else:
+                stale.append(plot)
+        plots = stale
+
+    if jobs > 1 and len(plots) > 1:
+        from multiprocessing import Pool
+
+        # Pool workers can't start pools of their own
+        for _, _, kwargs in plots:
+            if "processes" in kwargs:
+                kwargs["processes"] = 1
+
+        # Workers reopen the track store from disk rather than receiving a copy,
+        # and recompute the views of the tracks they use
+        print(f"Plotting {', '.join(name for name, _, _ in plots)}...")
+        with Pool(min(jobs, len(plots))) as pool:
+            it = pool.imap_unordered(partial(_plot, profile=profiler.enabled), plots)
+            for outfile, stages in it:
+                # Stages timed in the workers
+                profiler.stages += stages
+                cache.put(outfile, fingerprints[outfile])
+                print(f"Saved to {outfile}")
+    else:
+        for plot in plots:
+            print(f"Plotting {plot[0]}...")
+            outfile, _ = _plot(plot, profiler.enabled)
+            cache.put(outfile, fingerprints[outfile])
             print(f"Saved to {outfile}")
 
 
+def _snapshot(args) -> dict[str, str]:
+    # Identity of every input file, including activities.csv
+    from .sources import close_archives, source_exists, source_identity
+
+    # Reopen a bulk export zip, in case it was replaced
+    close_archives()
+    snapshot = {}
+    paths = _input_files(args.path)
+    if args.activities_path and source_exists(args.activities_path):
+        paths.append(args.activities_path)
+    for path in paths:
+        try:
+            snapshot[path] = source_identity(path)
+        except FileNotFoundError:
+            # Removed since it was listed
+            pass
+    return snapshot
+
+
+def _watch(args, data) -> None:
+    # Poll the input for new or changed files. Only those are parsed, the other
+    # tracks being copied from the current track store, and only the plots of
+    # the changed data are redrawn, in this process so that state kept with the
+    # data (such as the raster map's density) is updated rather than rebuilt.
+    import time
+
+    from .process_data import load_tracks
+
+    snapshot = _snapshot(args)
+    print(f"Watching {args.path} for changes every {args.watch:g} s (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(args.watch)
+            current = _snapshot(args)
+            if current == snapshot:
+                continue
+            changed = {
+                path
+                for path in snapshot.keys() | current.keys()
+                if snapshot.get(path) != current.get(path)
+            }
+            snapshot = current
+
+            updated = set()
+            changed_tracks = changed - {args.activities_path}
+            if changed_tracks:
+                filenames = [path for path in current if path != args.activities_path]
+                print(f"Processing data ({len(changed_tracks)} changed files)...")
+                tracks = load_tracks(
+                    filenames,
+                    args.distance,
+                    args.workers or None,
+                    args.chunksize or None,
+                    data.store,
+                    args.readers,
+                    args.file_timeout,
+                    args.file_memory * 1024**2,
+                )
+                if tracks.empty:
+                    # Keep the current tracks, but still pick up activities.csv
+                    print("No data to plot")
+                else:
+                    data.update(tracks=tracks)
+                    updated |= TRACK_PLOTS
+
+            if args.activities_path in changed and args.activities_path in current:
+                from .process_activities import process_activities
+
+                print("Processing activities...")
+                data.update(activities=process_activities(args.activities_path))
+                updated |= ACTIVITY_PLOTS
+
+            plots = [plot for plot in _plots(args, data) if plot[0] in updated]
+            _render(plots, force=args.force)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+def _plot(plot: tuple[str, tuple, dict], profile: bool = False) -> tuple[str, list]:
+    # Returns the output file and the stages timed while plotting
+    import importlib
+
+    from .profiling import profiler
+
+    name, args, kwargs = plot
+    profiler.enabled = profile
+    n_stages = len(profiler.stages)
+    with profiler.stage(f"plot {name}"):
+        import matplotlib.pyplot as plt
+
+        module = importlib.import_module(f".plot_{name}", __package__)
+        getattr(module, f"plot_{name}")(*args, **kwargs)
+        plt.close("all")
+    return kwargs["output_file"], profiler.stages[n_stages:]
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from .projection import convert_x, convert_y
+from .simplify import group_tracks, simplify_mask
+from .track_store import TrackStore
+
+# Views derived from activities.csv; all other views are derived from the tracks
+ACTIVITY_VIEWS = ("activity_times", "activities_fingerprint")
+
+
+class Dataset:
+    # Parsed tracks (a TrackStore or a DataFrame of points) and, optionally,
+    # activities from activities.csv, with the views the plots derive from them
+    # computed on first use and reused until the data is replaced.
+    #
+    # Every plot_* function accepts a Dataset, so notebooks and services that
+    # render many plots from the same data pay for each view only once.
+
+    def __init__(self, tracks=None, activities: pd.DataFrame | None = None):
+        self._tracks = tracks
+        self._activities = activities
+        self._views: dict[tuple, object] = {}
+        # Values kept across updates, with the activities they cover
+        self._accumulated: dict[tuple, tuple[object, set[str]]] = {}
+
+    @classmethod
+    def load(
+        cls,
+        filenames: list[str],
+        activities_path: str | None = None,
+        distance: str = "planar",
+        processes: int | None = None,
+        chunksize: int | None = None,
+    ) -> Dataset:
+        # Parse (or load from the cache) tracks, and activities.csv if given
+        from .process_data import load_tracks
+
+        tracks = load_tracks(filenames, distance, processes, chunksize)
+        activities = None
+        if activities_path:
+            from .process_activities import process_activities
+
+            activities = process_activities(activities_path)
+        return cls(tracks, activities)
+
+    def __getstate__(self):
+        # Views of the tracks are recomputed by the receiving process rather
+        # than copied, as a TrackStore is reopened from disk
+        views = {
+            key: value for key, value in self._views.items() if key[0] in ACTIVITY_VIEWS
+        }
+        return {**self.__dict__, "_views": views, "_accumulated": {}}
+
+    @property
+    def tracks(self):
+        return self._tracks
+
+    @property
+    def activities(self) -> pd.DataFrame | None:
+        return self._activities
+
+    @property
+    def store(self) -> TrackStore | None:
+        return self._tracks if isinstance(self._tracks, TrackStore) else None
+
+    def update(self, tracks=None, activities: pd.DataFrame | None = None) -> None:
+        # Replace the tracks and/or activities, dropping the views derived from
+        # the replaced data
+        if tracks is not None:
+            self._tracks = tracks
+            self._views = {
+                key: value
+                for key, value in self._views.items()
+                if key[0] in ACTIVITY_VIEWS
+            }
+        if activities is not None:
+            self._activities = activities
+            self._views = {
+                key: value
+                for key, value in self._views.items()
+                if key[0] not in ACTIVITY_VIEWS
+            }
+
+    def invalidate(self) -> None:
+        # Drop every view, for example after modifying the data in place
+        self._views.clear()
+        self._accumulated.clear()
+
+    def view(self, key: tuple, compute):
+        # The result of compute(), memoised under key until the data changes
+        try:
+            return self._views[key]
+        except KeyError:
+            value = self._views[key] = compute()
+            return value
+
+    def accumulate(self, key: tuple, compute, add):
+        # Like view(), but kept across update(). If activities have only been
+        # added since the value was computed, add(value, new) brings it up to
+        # date from a Dataset of just the new activities, or returns None to
+        # have it recomputed.
+        keys = self.activity_keys()
+        current = set(keys)
+        if key in self._accumulated:
+            value, covered = self._accumulated[key]
+            if covered <= current:
+                new = [i for i, k in enumerate(keys) if k not in covered]
+                if new:
+                    value = add(value, self.subset(np.array(new)))
+                if value is not None:
+                    self._accumulated[key] = (value, current)
+                    return value
+        value = compute()
+        self._accumulated[key] = (value, current)
+        return value
+
+    def subset(self, activities: np.ndarray) -> Dataset:
+        # A Dataset of the tracks of the activities at the given indices only
+        if self.store is not None:
+            return Dataset(self.store.read(None, activities))
+        df = self._grouped()[0]
+        names = [self.names()[i] for i in activities]
+        return Dataset(df[df["name"].isin(names)])
+
+    def __len__(self) -> int:
+        return len(self.names())
+
+    @property
+    def empty(self) -> bool:
+        return self.offsets()[-1] == 0
+
+    def _grouped(self) -> tuple[pd.DataFrame, np.ndarray]:
+        # A DataFrame of points with the rows of each activity contiguous
+        return self.view(("grouped",), lambda: group_tracks(self._tracks))
+
+    def offsets(self) -> np.ndarray:
+        # Row offsets of each activity in the point columns
+        if self.store is not None:
+            return self.store.offsets
+        return self._grouped()[1]
+
+    def names(self) -> list[str]:
+        def compute():
+            if self.store is not None:
+                return list(self.store.names)
+            df, offsets = self._grouped()
+            return df["name"].to_numpy()[offsets[:-1]].tolist()
+
+        return self.view(("names",), compute)
+
+    def activity_keys(self) -> list[str]:
+        # What identifies the data of each activity: the cache key of its source
+        # file in a TrackStore, otherwise its name
+        if self.store is not None and self.store.keys is not None:
+            return self.store.keys
+        return self.names()
+
+    def column(self, col: str) -> np.ndarray:
+        # Values of a point column, as float64 or (for time) UTC datetime64,
+        # with the points of each activity contiguous. Columns of a TrackStore
+        # stay memory-mapped.
+        def compute():
+            if self.store is not None:
+                return self.store.column(col)
+            values = self._grouped()[0][col]
+            if col == "time":
+                return pd.to_datetime(values, utc=True).dt.tz_localize(None).to_numpy()
+            return pd.to_numeric(values).to_numpy("float64", na_value=np.nan)
+
+        return self.view(("column", col), compute)
+
+    def activity_index(self) -> pd.DataFrame:
+        # One row per activity: name, start time and row range in the columns
+        def compute():
+            if self.store is not None:
+                return self.store.activities()
+            df, offsets = self._grouped()
+            start_times = df.groupby("name", observed=True, sort=False)["time"].min()
+            return pd.DataFrame(
+                {
+                    "name": self.names(),
+                    "time": start_times.reindex(self.names()).reset_index(drop=True),
+                    "start": offsets[:-1],
+                    "stop": offsets[1:],
+                }
+            )
+
+        return self.view(("activity_index",), compute)
+
+    def start_times(self) -> pd.Series:
+        # Start time of each activity, by name
+        return self.activity_index().set_index("name")["time"]
+
+    def projected(
+        self, lon_min=None, lon_max=None, lat_min=None, lat_max=None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Web Mercator x and y of the points inside the given bounds, and the
+        # row offsets of each activity with points among them
+        key = ("projected", lon_min, lon_max, lat_min, lat_max)
+        return self.view(key, lambda: self._project(lon_min, lon_max, lat_min, lat_max))
+
+    def _project(self, lon_min, lon_max, lat_min, lat_max):
+        lon = self.column("lon")
+        lat = self.column("lat")
+        offsets = self.offsets()
+
+        # Skip activities outside the bounds without reading their points, and
+        # only clip points if some activity crosses the bounds
+        clip = any(v is not None for v in (lon_min, lon_max, lat_min, lat_max))
+        if clip and self.store is not None:
+            selected, contained = self.store.select(lon_min, lon_max, lat_min, lat_max)
+            rows, offsets = self.store.rows(selected)
+            if rows is not None:
+                lon = lon[rows]
+                lat = lat[rows]
+            clip = not contained.all()
+
+        if clip:
+            inside = np.ones(len(lon), dtype=bool)
+            if lon_min is not None:
+                inside &= lon >= lon_min
+            if lon_max is not None:
+                inside &= lon <= lon_max
+            if lat_min is not None:
+                inside &= lat >= lat_min
+            if lat_max is not None:
+                inside &= lat <= lat_max
+            if not inside.all():
+                lon = lon[inside]
+                lat = lat[inside]
+                # Activities left without points are dropped
+                offsets = np.unique(np.searchsorted(np.flatnonzero(inside), offsets))
+
+        return convert_x(np.asarray(lon)), convert_y(np.asarray(lat)), offsets
+
+    def normalized_distance(self) -> np.ndarray:
+        # Distance along each activity scaled to [0, 1]
+        def compute():
+            dist = self.column("dist")
+            offsets = self.offsets()
+            counts = np.diff(offsets)
+            if not len(dist):
+                return np.asarray(dist)
+            nonempty = counts > 0
+            starts = offsets[:-1][nonempty]
+            lo = np.repeat(np.fmin.reduceat(dist, starts), counts[nonempty])
+            hi = np.repeat(np.fmax.reduceat(dist, starts), counts[nonempty])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return (dist - lo) / (hi - lo)
+
+        return self.view(("normalized_distance",), compute)
+
+    def simplified(
+        self, key: tuple, x: np.ndarray, y: np.ndarray, offsets: np.ndarray
+    ) -> np.ndarray:
+        # Keep mask of the tracks simplified in pixel coordinates, memoised
+        # under a key describing the plot and its output size (and, with a
+        # TrackStore, also cached on disk)
+        return self.view(
+            ("simplified", *key),
+            lambda: simplify_mask(x, y, offsets, self.store, key),
+        )
+
+    def tracks_fingerprint(
+        self, lon_min=None, lon_max=None, lat_min=None, lat_max=None
+    ) -> str:
+        # Digest of the tracks, or of only those overlapping the given bounds
+        def compute():
+            digest = hashlib.md5()
+            if self.store is not None and self.store.keys is not None:
+                selected, _ = self.store.select(lon_min, lon_max, lat_min, lat_max)
+                for i in selected:
+                    digest.update(f"{self.store.keys[i]}\0".encode())
+            else:
+                digest.update(_frame_digest(self._tracks))
+            return digest.hexdigest()
+
+        key = ("tracks_fingerprint", lon_min, lon_max, lat_min, lat_max)
+        return self.view(key, compute)
+
+    def activities_fingerprint(self) -> str:
+        # Digest of the activities
+        return self.view(
+            ("activities_fingerprint",),
+            lambda: hashlib.md5(_frame_digest(self._activities)).hexdigest(),
+        )
+
+    def activity_times(self, local_timezone: str | None = None):
+        # Local times of the activities in activities.csv (see ActivityTimes)
+        from .activity_times import ActivityTimes
+
+        if self._activities is None:
+            msg = "This dataset has no activities"
+            raise ValueError(msg)
+        return self.view(
+            ("activity_times", local_timezone),
+            lambda: ActivityTimes(self._activities, local_timezone),
+        )
+
+
+def _frame_digest(df: pd.DataFrame | None) -> bytes:
+    if df is None:
+        return b""
+    values = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return repr(list(df.columns)).encode() + values.tobytes()
+
+
+def as_dataset(data) -> Dataset:
+    # Wrap a TrackStore or DataFrame of points passed to a plot
+    return data if isinstance(data, Dataset) else Dataset(data)
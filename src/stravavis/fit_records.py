@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import struct
+
+import numpy as np
+
+from .sources import open_source
+
+# Minimal FIT decoder that only extracts position, altitude and timestamp from
+# record messages. Message headers are walked in Python, but field values are
+# gathered and converted with NumPy in one pass per message definition.
+# Ref: https://developer.garmin.com/fit/protocol/
+
+RECORD_MESG_NUM = 20
+
+# Record message field numbers: (name, expected size, signed)
+RECORD_FIELDS = {
+    253: ("timestamp", 4, False),
+    0: ("position_lat", 4, True),
+    1: ("position_long", 4, True),
+    2: ("altitude", 2, False),
+    78: ("enhanced_altitude", 4, False),
+}
+
+# Seconds between the Unix epoch and the FIT epoch (1989-12-31T00:00:00Z)
+FIT_UTC_REFERENCE = 631065600
+# Smaller timestamps are relative to device power-on, not absolute
+FIT_DATETIME_MIN = 0x10000000
+
+SEMICIRCLES = 2**32 / 360
+
+INVALID = {
+    (4, True): 0x7FFFFFFF,
+    (4, False): 0xFFFFFFFF,
+    (2, False): 0xFFFF,
+}
+
+
+class UnsupportedFIT(Exception):
+    pass
+
+
+# Compiled layouts of record definitions, shared by every file a worker decodes
+_layouts: dict[tuple, dict[str, tuple[int, np.dtype, int]]] = {}
+
+
+def _record_layout(arch: int, fields: tuple) -> dict[str, tuple[int, np.dtype, int]]:
+    key = (arch, fields)
+    try:
+        return _layouts[key]
+    except KeyError:
+        pass
+
+    endian = ">" if arch else "<"
+    layout = {}
+    offset = 0
+    for num, size in fields:
+        if num in RECORD_FIELDS:
+            name, expected, signed = RECORD_FIELDS[num]
+            if size != expected:
+                msg = f"Unexpected size {size} for record field {name}"
+                raise UnsupportedFIT(msg)
+            dtype = np.dtype(f"{endian}{'i' if signed else 'u'}{size}")
+            layout[name] = (offset, dtype, INVALID[size, signed])
+        offset += size
+
+    _layouts[key] = layout
+    return layout
+
+
+# Walk one FIT file (or a chain of them) and collect the byte offsets of every
+# record message, grouped by the definition that describes them
+def _scan(data: bytes) -> list[tuple[dict, list[int]]]:
+    groups = []
+    pos = 0
+    while pos < len(data):
+        if len(data) - pos < 12 or data[pos + 8 : pos + 12] != b".FIT":
+            if pos:
+                # Ignore trailing padding after a complete file
+                break
+            msg = "Missing FIT header"
+            raise UnsupportedFIT(msg)
+        header_size = data[pos]
+        (data_size,) = struct.unpack_from("<I", data, pos + 4)
+        pos += header_size
+        end = pos + data_size
+        if end > len(data):
+            msg = "Truncated FIT file"
+            raise UnsupportedFIT(msg)
+
+        # Local message type -> (message size, offsets or None if not a record)
+        local = {}
+        while pos < end:
+            header = data[pos]
+            pos += 1
+            if header & 0x80:
+                msg = "Compressed timestamp headers are not supported"
+                raise UnsupportedFIT(msg)
+
+            if header & 0x40:
+                # Definition message
+                arch = data[pos + 1]
+                (mesg_num,) = struct.unpack_from(">H" if arch else "<H", data, pos + 2)
+                n_fields = data[pos + 4]
+                fields = tuple(
+                    (data[pos + 5 + 3 * i], data[pos + 6 + 3 * i])
+                    for i in range(n_fields)
+                )
+                pos += 5 + 3 * n_fields
+                size = sum(field_size for _, field_size in fields)
+                if header & 0x20:
+                    # Developer fields only contribute to the message size
+                    n_dev = data[pos]
+                    size += sum(data[pos + 2 + 3 * i] for i in range(n_dev))
+                    pos += 1 + 3 * n_dev
+
+                offsets = None
+                if mesg_num == RECORD_MESG_NUM:
+                    offsets = []
+                    groups.append((_record_layout(arch, fields), offsets))
+                local[header & 0x0F] = (size, offsets)
+            else:
+                # Data message
+                try:
+                    size, offsets = local[header & 0x0F]
+                except KeyError:
+                    msg = f"Undefined local message type {header & 0x0F}"
+                    raise UnsupportedFIT(msg) from None
+                if offsets is not None:
+                    offsets.append(pos)
+                pos += size
+
+        # Skip the file CRC
+        pos = end + 2
+
+    return groups
+
+
+def _gather(
+    buf: np.ndarray, offsets: np.ndarray, layout: dict, name: str
+) -> np.ndarray:
+    # Values of one field for all messages, with invalid values as NaN
+    if name not in layout:
+        return np.full(len(offsets), np.nan)
+    offset, dtype, invalid = layout[name]
+    idx = offsets[:, None] + offset + np.arange(dtype.itemsize)
+    raw = np.ascontiguousarray(buf[idx]).view(dtype).ravel()
+    values = raw.astype("float64")
+    values[raw == np.array(invalid).astype(dtype)] = np.nan
+    return values
+
+
+def read_fit_points(fitfile: str) -> dict[str, np.ndarray]:
+    with open_source(fitfile) as f:
+        data = f.read()
+
+    try:
+        groups = _scan(data)
+    except (IndexError, struct.error) as e:
+        msg = "Truncated FIT file"
+        raise UnsupportedFIT(msg) from e
+
+    buf = np.frombuffer(data, dtype="uint8")
+    columns = {
+        name: []
+        for name in ("offset", "lat", "lon", "altitude", "enhanced_altitude", "time")
+    }
+    for layout, offsets in groups:
+        if not offsets:
+            continue
+        offsets = np.array(offsets, dtype="int64")
+        columns["offset"].append(offsets)
+        columns["lat"].append(_gather(buf, offsets, layout, "position_lat"))
+        columns["lon"].append(_gather(buf, offsets, layout, "position_long"))
+        columns["altitude"].append(_gather(buf, offsets, layout, "altitude"))
+        columns["enhanced_altitude"].append(
+            _gather(buf, offsets, layout, "enhanced_altitude")
+        )
+        columns["time"].append(_gather(buf, offsets, layout, "timestamp"))
+
+    if not columns["offset"]:
+        empty = np.empty(0)
+        return {"lon": empty, "lat": empty, "ele": empty, "time": empty.astype("i8")}
+
+    # Restore file order across definitions
+    order = np.argsort(np.concatenate(columns["offset"]), kind="stable")
+    lat, lon, altitude, enhanced_altitude, time = (
+        np.concatenate(columns[name])[order]
+        for name in ("lat", "lon", "altitude", "enhanced_altitude", "time")
+    )
+
+    # Only keep points with a position
+    keep = ~(np.isnan(lat) | np.isnan(lon))
+    lat = lat[keep] / SEMICIRCLES
+    lon = lon[keep] / SEMICIRCLES
+
+    # Altitude is scale 5, offset 500; fall back to the 32-bit enhanced altitude
+    altitude = altitude[keep]
+    enhanced_altitude = enhanced_altitude[keep]
+    ele = np.where(np.isnan(altitude), enhanced_altitude, altitude) / 5 - 500
+
+    time = time[keep]
+    time[time < FIT_DATETIME_MIN] = np.nan
+    ns = np.full(len(time), np.iinfo("int64").min)
+    valid = ~np.isnan(time)
+    ns[valid] = (time[valid].astype("int64") + FIT_UTC_REFERENCE) * 1_000_000_000
+
+    return {"lon": lon, "lat": lat, "ele": ele, "time": ns}
@@ -2,9 +2,8 @@ from __future__ import annotations
 
 import calmap
 import matplotlib.pyplot as plt
-import pandas as pd
 
-ACTIVITY_FORMAT = "%b %d, %Y, %H:%M:%S %p"
+from .activity_times import activity_times
 
 
 def plot_calendar(
@@ -15,27 +14,23 @@ def plot_calendar(
     fig_height=15,
     fig_width=9,
     output_file="calendar.png",
+    local_timezone=None,
 ):
     # Create a new figure
     plt.figure()
 
-    # Process data
-    activities["Activity Date"] = pd.to_datetime(
-        activities["Activity Date"], format=ACTIVITY_FORMAT
-    )
-    activities["date"] = activities["Activity Date"].dt.date
-    activities = activities.groupby(["date"])["Distance"].sum()
-    activities.index = pd.to_datetime(activities.index)
-    activities.clip(0, max_dist, inplace=True)
+    # Total distance of each day
+    daily = activity_times(activities, local_timezone).daily_distance
+    daily = daily.clip(0, max_dist)
 
     if year_min:
-        activities = activities[activities.index.year >= year_min]
+        daily = daily[daily.index.year >= year_min]
 
     if year_max:
-        activities = activities[activities.index.year <= year_max]
+        daily = daily[daily.index.year <= year_max]
 
     # Create heatmap
-    fig, ax = calmap.calendarplot(data=activities)
+    fig, ax = calmap.calendarplot(data=daily)
 
     # Save plot
     fig.set_figheight(fig_height)
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import pandas as pd
 from plotnine import (
     aes,
     element_blank,
@@ -17,6 +16,8 @@ from plotnine import (
     ylab,
 )
 
+from .activity_times import activity_times
+
 
 def plot_dumbbell(
     activities,
@@ -27,49 +28,19 @@ def plot_dumbbell(
     fig_width=34,
     output_file="dumbbell.png",
 ):
-    # Convert activity start date to datetime
-    activities["Activity Date"] = pd.to_datetime(activities["Activity Date"])
-
-    # Convert to local timezone (if given)
-    if local_timezone:
-        activities["Activity Date"] = (
-            pd.to_datetime(activities["Activity Date"])
-            .dt.tz_localize(tz="UTC", nonexistent="NaT", ambiguous="NaT")
-            .dt.tz_convert(local_timezone)
-        )
-
-    # Get activity start and end times
-    activities["start"] = activities["Activity Date"]
-    activities["duration"] = pd.to_timedelta(activities["Elapsed Time"], unit="s")
-    activities["end"] = pd.to_datetime(activities["start"] + activities["duration"])
+    # Local start and end times of day
+    times = activity_times(activities, local_timezone).table
 
     # Remove activities outside the year_min -> year_max window
-    activities["year"] = activities["Activity Date"].dt.year
-
     if year_min:
-        activities = activities[activities["year"] >= year_min]
+        times = times[times["year"] >= year_min]
 
     if year_max:
-        activities = activities[activities["year"] <= year_max]
-
-    # Get day of year and time of day data
-    activities["dayofyear"] = activities["Activity Date"].dt.dayofyear
-    activities["start_time"] = activities["start"].dt.time
-    activities["end_time"] = activities["end"].dt.time
-    activities["x"] = (
-        activities["start"].dt.hour
-        + activities["start"].dt.minute / 60
-        + activities["start"].dt.second / 60 / 60
-    )
-    activities["xend"] = (
-        activities["end"].dt.hour
-        + activities["end"].dt.minute / 60
-        + activities["end"].dt.second / 60 / 60
-    )
+        times = times[times["year"] <= year_max]
 
     # Create plotnine / ggplot
     p = (
-        ggplot(activities)
+        ggplot(times)
         + geom_segment(
             aes(x="x", y="dayofyear", xend="xend", yend="dayofyear"), size=0.1
         )
@@ -1,41 +1,65 @@
 from __future__ import annotations
 
 import matplotlib.pyplot as plt
-import pandas as pd
-from rich.progress import track
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
 
+from .dataset import as_dataset
+from .simplify import pixel_scale
 
-def plot_landscape(df, output_file="landscape.png"):
-    # Create a new figure
-    plt.figure()
+DPI = 600
 
-    # Convert ele to numeric
-    df["ele"] = pd.to_numeric(df["ele"])
 
-    # Create a list of activity names
-    activities = df["name"].unique()
+def plot_landscape(df, output_file="landscape.png", simplify=True):
+    # Create a new figure
+    fig = plt.figure()
 
-    # Normalize dist
-    processed = []
+    # Distance along each activity normalized to [0, 1], and elevation
+    data = as_dataset(df)
+    offsets = data.offsets()
+    dist_norm = data.normalized_distance()
+    ele = data.column("ele")
 
-    for activity in track(activities, "Processing tracks"):
-        df_i = df[df["name"] == activity].copy()
-        df_i.loc[:, "dist_norm"] = (df_i["dist"] - df_i["dist"].min()) / (
-            df_i["dist"].max() - df_i["dist"].min()
-        )
-        processed.append(df_i)
+    # Drop points that would fall on the same output pixel
+    if simplify and len(dist_norm):
+        width = fig.get_figwidth() * 0.9 * DPI
+        height = fig.get_figheight() * 0.9 * DPI
+        x = dist_norm * width
+        y = ele * pixel_scale(ele, None, height)
+        keep = data.simplified(("landscape", width, height), x, y, offsets)
+        dist_norm = dist_norm[keep]
+        ele = ele[keep]
+        offsets = np.searchsorted(np.flatnonzero(keep), offsets)
 
-    df = pd.concat(processed)
+    # Split activities into runs of points with values, as fill_between does
+    valid = ~(np.isnan(dist_norm) | np.isnan(ele))
+    starts = np.zeros(len(valid), dtype=bool)
+    starts[offsets[:-1][offsets[:-1] < len(starts)]] = True
+    starts[1:] |= valid[1:] != valid[:-1]
+    bounds = np.append(np.flatnonzero(starts), len(valid))
+    runs = [
+        (start, stop)
+        for start, stop in zip(bounds[:-1], bounds[1:])
+        if stop - start > 1 and valid[start]
+    ]
 
-    # Plot activities one by one
-    for activity in track(activities, "Plotting activities"):
-        x = df[df["name"] == activity]["dist_norm"]
-        y = df[df["name"] == activity]["ele"]
-        plt.fill_between(x, y, color="black", alpha=0.03, linewidth=0)
-        plt.plot(x, y, color="black", alpha=0.125, linewidth=0.25)
+    # Plot all activities as one collection of fills and one of lines
+    profiles = [np.column_stack([dist_norm[a:b], ele[a:b]]) for a, b in runs]
+    areas = [
+        np.vstack([[profile[0, 0], 0], profile, [profile[-1, 0], 0]])
+        for profile in profiles
+    ]
+    ax = plt.gca()
+    ax.add_collection(
+        PolyCollection(areas, facecolors="black", alpha=0.03, linewidths=0)
+    )
+    ax.add_collection(
+        LineCollection(profiles, colors="black", alpha=0.125, linewidths=0.25)
+    )
+    ax.autoscale_view()
 
     # Update plot aesthetics
     plt.axis("off")
     plt.margins(0)
     plt.subplots_adjust(left=0.05, right=0.95, bottom=0.05, top=0.95)
-    plt.savefig(output_file, dpi=600)
+    plt.savefig(output_file, dpi=DPI)
@@ -1,29 +1,17 @@
 from __future__ import annotations
 
-from math import log, pi, tan
-
 import matplotlib.pyplot as plt
-from rich.progress import track
-
-# Dummy units
-MAP_WIDTH = 1
-MAP_HEIGHT = 1
-
-
-def convert_x(lon):
-    # Get x value
-    x = (lon + 180) * (MAP_WIDTH / 360)
-    return x
+import numpy as np
+from matplotlib.collections import LineCollection
 
+from .dataset import as_dataset
+from .projection import MAP_HEIGHT, MAP_WIDTH, convert_x, convert_y  # noqa: F401
+from .raster import fit_extent, rasterize_tracks, tone_map
+from .tiles import render_tiles
 
-def convert_y(lat):
-    # Convert from degrees to radians
-    lat_rad = lat * pi / 180
+DPI = 600
 
-    # Get y value
-    mercator_n = log(tan((pi / 4) + (lat_rad / 2)))
-    y = (MAP_HEIGHT / 2) + (MAP_WIDTH * mercator_n / (2 * pi))
-    return y
+RENDER_MODES = ("vector", "raster", "tiles")
 
 
 def plot_map(
@@ -35,40 +23,103 @@ def plot_map(
     alpha=0.3,
     linewidth=0.3,
     output_file="map.png",
+    simplify=True,
+    render="vector",
+    tone="log",
+    processes=None,
+    zoom_min=0,
+    zoom_max=14,
 ):
-    # Create a new figure
-    plt.figure()
-
-    # Remove data outside the input ranges for lon / lat
-    if lon_min is not None:
-        df = df[df["lon"] >= lon_min]
-
-    if lon_max is not None:
-        df = df[df["lon"] <= lon_max]
+    data = as_dataset(df)
+    bounds = (lon_min, lon_max, lat_min, lat_max)
+
+    if render == "raster":
+        # Accumulate track density straight into an image the size of the figure,
+        # so memory depends on the output size rather than the number of points.
+        # The density is kept with the data, and activities added later are
+        # drawn onto it.
+        fig_width, fig_height = plt.rcParams["figure.figsize"]
+        shape = (round(fig_height * DPI), round(fig_width * DPI))
+        grid, _ = data.accumulate(
+            ("raster", *bounds, shape),
+            lambda: _density(*data.projected(*bounds), shape, processes),
+            lambda density, new: _add_density(
+                density, *new.projected(*bounds), shape, processes
+            ),
+        )
+        plt.imsave(output_file, tone_map(grid, tone), cmap="gray_r", vmin=0, vmax=1)
+        return
+
+    # Transform to Mercator projection so maps aren't squashed away from equator,
+    # keeping only data inside the input ranges for lon / lat
+    x, y, offsets = data.projected(*bounds)
+
+    if render == "tiles":
+        # A pyramid of slippy map tiles in the output_file directory
+        return render_tiles(x, y, offsets, output_file, zoom_min, zoom_max, processes)
+    if render != "vector":
+        msg = f"Unknown render mode {render!r}, expected one of {RENDER_MODES}"
+        raise ValueError(msg)
 
-    if lat_min is not None:
-        df = df[df["lat"] >= lat_min]
-
-    if lat_max is not None:
-        df = df[df["lat"] <= lat_max]
-
-    # Create a list of activity names
-    activities = df["name"].unique()
-
-    # Plot activities one by one
-    for activity in track(activities, "Plotting activities"):
-        x = df[df["name"] == activity]["lon"]
-        y = df[df["name"] == activity]["lat"]
-
-        # Transform to Mercator projection so maps aren't squashed away from equator
-        x = x.transform(convert_x)
-        y = y.transform(convert_y)
-
-        plt.plot(x, y, color="black", alpha=alpha, linewidth=linewidth)
+    # Create a new figure
+    fig = plt.figure()
+
+    # Drop points that would fall on the same output pixel
+    if simplify and len(x):
+        width = fig.get_figwidth() * 0.9 * DPI
+        height = fig.get_figheight() * 0.9 * DPI
+        x_span = max(np.nanmax(x) - np.nanmin(x), 1e-12)
+        y_span = max(np.nanmax(y) - np.nanmin(y), 1e-12)
+        scale = min(width / x_span, height / y_span)
+        key = ("map", lon_min, lon_max, lat_min, lat_max, width, height)
+        keep = data.simplified(key, x * scale, y * scale, offsets)
+        x = x[keep]
+        y = y[keep]
+        offsets = np.searchsorted(np.flatnonzero(keep), offsets)
+
+    # Plot all activities as a single collection of lines
+    tracks = np.split(np.column_stack([x, y]), offsets[1:-1])
+    lines = LineCollection(
+        tracks,
+        colors="black",
+        alpha=alpha,
+        linewidths=linewidth,
+        capstyle=plt.rcParams["lines.solid_capstyle"],
+        joinstyle=plt.rcParams["lines.solid_joinstyle"],
+    )
+    ax = plt.gca()
+    ax.add_collection(lines)
+    ax.autoscale_view()
 
     # Update plot aesthetics
     plt.axis("off")
     plt.axis("equal")
     plt.margins(0)
     plt.subplots_adjust(left=0.05, right=0.95, bottom=0.05, top=0.95)
-    plt.savefig(output_file, dpi=600)
+    plt.savefig(output_file, dpi=DPI)
+
+
+def _density(x, y, offsets, shape, processes):
+    # Density of the tracks over an extent fitted to them, and the bounds of the
+    # tracks it was fitted to
+    if not len(x) or np.isnan(x).all():
+        return np.zeros(shape), None
+    bounds = (np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y))
+    extent = fit_extent(x, y, shape)
+    return rasterize_tracks(x, y, offsets, extent, shape, processes), bounds
+
+
+def _add_density(density, x, y, offsets, shape, processes):
+    # Draw new tracks onto a density, unless they extend beyond the tracks it
+    # was fitted to and so would change its extent
+    grid, bounds = density
+    if not len(x) or np.isnan(x).all():
+        return density
+    if bounds is None:
+        return None
+    x0, x1, y0, y1 = bounds
+    if np.nanmin(x) < x0 or np.nanmax(x) > x1 or np.nanmin(y) < y0 or np.nanmax(y) > y1:
+        return None
+    extent = fit_extent(np.array([x0, x1]), np.array([y0, y1]), shape)
+    grid += rasterize_tracks(x, y, offsets, extent, shape, processes)
+    return grid, bounds
@@ -1,12 +1,115 @@
 from __future__ import annotations
 
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
 import pandas as pd
 
+from .cache import CACHE_DIR
+from .sources import open_source, source_identity
+
+# Format of "Activity Date" in activities.csv, for example "Jun 2, 2023, 1:02:03 PM"
+ACTIVITY_FORMAT = "%b %d, %Y, %I:%M:%S %p"
+
+# Columns of activities.csv used by the plots, and their dtypes. Of the ~90
+# columns in the export, "Distance" and "Elapsed Time" appear twice; the first
+# of each (kilometres and seconds) is used.
+ACTIVITY_COLUMNS = {
+    "Activity ID": "int64",
+    "Activity Date": "str",
+    "Activity Name": "str",
+    "Activity Type": "category",
+    "Elapsed Time": "float64",
+    "Distance": "float64",
+    "Filename": "str",
+}
+
+# Rows parsed at a time, so large multi-athlete files are never held in memory
+# with all of their columns
+CHUNK_ROWS = 100_000
+
+# Bump whenever the columns or dtypes returned by process_activities change
+ACTIVITIES_VERSION = 1
+
+# Number of parsed activities.csv files kept in the cache
+MAX_ACTIVITY_TABLES = 3
+
+
+def parse_activity_dates(dates: pd.Series) -> pd.Series:
+    # Parse with the export's format, falling back to inferring the format of
+    # dates written differently (for example by other locales)
+    parsed = pd.to_datetime(dates, format=ACTIVITY_FORMAT, errors="coerce")
+    retry = parsed.isna() & dates.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(dates[retry], format="mixed", errors="coerce")
+    return parsed
+
+
+def read_activities(activities_path, chunksize: int = CHUNK_ROWS) -> pd.DataFrame:
+    # Read the used columns of activities.csv with their dtypes, parsing dates
+    # one chunk at a time
+    with open_source(activities_path) as f:
+        reader = pd.read_csv(
+            f,
+            usecols=lambda column: column in ACTIVITY_COLUMNS,
+            dtype=ACTIVITY_COLUMNS,
+            thousands=",",
+            chunksize=chunksize,
+        )
+        chunks = []
+        for chunk in reader:
+            if "Activity Date" in chunk:
+                chunk["Activity Date"] = parse_activity_dates(chunk["Activity Date"])
+            chunks.append(chunk)
+
+    activities = pd.concat(chunks, ignore_index=True)
+    if "Activity Type" in activities:
+        # Categories differ between chunks
+        activities["Activity Type"] = activities["Activity Type"].astype("category")
+    return activities
+
+
+def _cache_path(activities_path, cache_dir: Path) -> Path:
+    ident = f"{ACTIVITIES_VERSION}\0{source_identity(activities_path)}"
+    key = hashlib.md5(ident.encode("utf-8")).hexdigest()
+    return Path(cache_dir) / "activities" / f"{key}.pkl"
+
+
+def _prune(cache_dir: Path, keep: int = MAX_ACTIVITY_TABLES) -> None:
+    tables = sorted(
+        (Path(cache_dir) / "activities").glob("*.pkl"),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for path in tables[keep:]:
+        path.unlink(missing_ok=True)
+
+
+def process_activities(
+    activities_path, chunksize: int = CHUNK_ROWS, cache_dir: Path = CACHE_DIR
+) -> pd.DataFrame:
+    # Import activities.csv from Strava bulk export zip, or from inside the zip.
+    # The parsed table is cached until the file changes.
+    cache_path = _cache_path(activities_path, cache_dir)
+    try:
+        with open(cache_path, "rb") as f:
+            activities = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        pass
+    else:
+        # Touch the entry so pruning keeps recently used tables
+        os.utime(cache_path)
+        return activities
 
-def process_activities(activities_path):
-    # Import activities.csv from Strava bulk export zip
-    activities = pd.read_csv(activities_path)
+    activities = read_activities(activities_path, chunksize)
 
-    # Further processing (to come)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(activities, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache_path)
+    _prune(cache_dir)
 
     return activities
@@ -1,153 +1,731 @@
 from __future__ import annotations
 
-import hashlib
+import io
 import math
-import tempfile
-from multiprocessing import Pool
-from pathlib import Path
+import os
+import signal
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
 
-import fit2gpx
-import gpxpy
+import numpy as np
 import pandas as pd
 from rich.progress import track
 
+from .cache import TrackCache, file_key, prune_stores, store_dir
+from .fit_records import SEMICIRCLES, UnsupportedFIT, read_fit_points
+from .profiling import profiler
+from .sources import (
+    open_source,
+    prefetched,
+    read_source,
+    source_size,
+    track_format,
+)
+from .track_store import COLUMNS, TrackStore, to_columns
 
-def process_file(fpath: str) -> pd.DataFrame | None:
-    if fpath.endswith(".gpx"):
-        return process_gpx(fpath)
-    elif fpath.endswith(".fit"):
-        return process_fit(fpath)
+# Mean Earth radius in metres, for haversine distances
+EARTH_RADIUS = 6_371_008.8
+
+DISTANCE_METRICS = ("planar", "haversine")
+
+# Threads reading files ahead of the parsing processes, so the workers are not
+# left waiting on slow disks or network drives (0 to have workers read files)
+READERS = 8
+
+# Batches in flight per parsing process
+READ_AHEAD = 2
+
+# Bytes of files read ahead that the workers have yet to parse. Batches over
+# budget are split; a single file larger than this is still read, on its own.
+READ_AHEAD_BYTES = 256 * 1024**2
+
+# Budget for parsing a single file, in seconds and bytes of memory (0 for no
+# limit). Files over budget fail, and are quarantined like corrupt files
+# (after a second try for timeouts, see RETRIED_ERRORS).
+FILE_TIMEOUT = 120
+FILE_MEMORY = 2 * 1024**3
+
+# Failed files listed after parsing
+LISTED_FAILURES = 10
+
+
+class FileTimeout(BaseException):
+    # Not an Exception, so parsers catching broadly (gpxpy re-raises anything as
+    # a syntax error) don't mistake a timeout for a corrupt file
+    pass
+
+
+# Failures that may not happen again, such as a flaky read or a timeout on a
+# busy machine. Files failing with these are parsed again on their own before
+# being quarantined.
+RETRIED_ERRORS = (OSError, EOFError, zlib.error, zipfile.BadZipFile, FileTimeout)
+
+
+# Paths may point inside a zip archive and may be gzipped, e.g.
+# "export.zip/activities/1234.fit.gz"
+def process_file(fpath: str, distance: str = "planar") -> pd.DataFrame:
+    fmt = track_format(fpath)
+    if fmt == ".gpx":
+        return process_gpx(fpath, distance)
+    elif fmt == ".fit":
+        return process_fit(fpath, distance)
+    msg = f"Unsupported file format: {fpath}"
+    raise ValueError(msg)
+
+
+# Cumulative distance along each segment, restarting at zero for every segment.
+# "planar" is the Euclidean distance in degrees, "haversine" is great-circle metres.
+def segment_distances(
+    lon: np.ndarray,
+    lat: np.ndarray,
+    segment_starts: list[int] | None = None,
+    distance: str = "planar",
+) -> np.ndarray:
+    lon = np.asarray(lon, dtype="float64")
+    lat = np.asarray(lat, dtype="float64")
+
+    steps = np.zeros(len(lon))
+    if distance == "planar":
+        steps[1:] = np.sqrt(np.diff(lon) ** 2 + np.diff(lat) ** 2)
+    elif distance == "haversine":
+        lon_rad = np.radians(lon)
+        lat_rad = np.radians(lat)
+        h = (
+            np.sin(np.diff(lat_rad) / 2) ** 2
+            + np.cos(lat_rad[:-1])
+            * np.cos(lat_rad[1:])
+            * np.sin(np.diff(lon_rad) / 2) ** 2
+        )
+        steps[1:] = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(h, 1)))
+    else:
+        msg = f"Unknown distance {distance!r}, expected one of {DISTANCE_METRICS}"
+        raise ValueError(msg)
+
+    # No step between the last point of one segment and the first of the next
+    if segment_starts is None:
+        segment_starts = [0] if len(lon) else []
+    bounds = [*segment_starts, len(lon)]
+    dist = np.empty(len(lon))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        steps[start] = 0
+        np.cumsum(steps[start:stop], out=dist[start:stop])
+    return dist
+
+
+class _UnsupportedGPX(Exception):
+    pass
+
+
+# Stream track points straight into typed arrays, without building the gpxpy
+# object tree. Raises _UnsupportedGPX for anything gpxpy should handle instead.
+def read_gpx_points(gpxfile: str) -> dict[str, np.ndarray]:
+    lon = array("d")
+    lat = array("d")
+    ele = array("d")
+    time = []
+    segment_starts = []
+    segment_start = 0
+
+    try:
+        with open_source(gpxfile) as f:
+            for _, elem in ET.iterparse(f, events=("end",)):
+                tag = elem.tag
+                if tag.endswith("trkpt"):
+                    ns = tag[:-5]
+                    x = elem.get("lon")
+                    y = elem.get("lat")
+                    if x is None or y is None:
+                        raise _UnsupportedGPX
+                    lon.append(float(x))
+                    lat.append(float(y))
+                    z = elem.findtext(ns + "ele")
+                    ele.append(float(z) if z and z.strip() else math.nan)
+                    time.append(elem.findtext(ns + "time") or None)
+                    elem.clear()
+                elif tag.endswith("trkseg"):
+                    if len(lon) > segment_start:
+                        segment_starts.append(segment_start)
+                    segment_start = len(lon)
+                    elem.clear()
+
+        # Truncate to microseconds, as gpxpy does
+        time = pd.to_datetime(time, utc=True, format="ISO8601")
+        time = time.floor("us").as_unit("ns")
+    except (ET.ParseError, ValueError, TypeError) as e:
+        raise _UnsupportedGPX from e
+
+    return {
+        "lon": np.frombuffer(lon),
+        "lat": np.frombuffer(lat),
+        "ele": np.frombuffer(ele),
+        "time": time.asi8,
+        "segment_starts": segment_starts,
+    }
 
 
 # Function for processing an individual GPX file
 # Ref: https://pypi.org/project/gpxpy/
-def process_gpx(gpxfile: str) -> pd.DataFrame | None:
-    with open(gpxfile, encoding="utf-8") as f:
-        try:
-            activity = gpxpy.parse(f)
-        except gpxpy.mod_gpx.GPXException as e:
-            print(f"\nSkipping {gpxfile}: {type(e).__name__}: {e}")
-            return None
+def process_gpx(gpxfile: str, distance: str = "planar") -> pd.DataFrame:
+    try:
+        points = read_gpx_points(gpxfile)
+    except _UnsupportedGPX:
+        points = read_gpx_points_gpxpy(gpxfile)
+
+    df = pd.DataFrame(
+        {
+            "lon": points["lon"],
+            "lat": points["lat"],
+            "ele": points["ele"],
+            "time": pd.to_datetime(points["time"], utc=True, unit="ns"),
+            "name": gpxfile,
+            "dist": segment_distances(
+                points["lon"], points["lat"], points["segment_starts"], distance
+            ),
+        },
+        columns=["lon", "lat", "ele", "time", "name", "dist"],
+    )
+
+    return df
+
+
+# Fallback for files the streaming reader can't handle
+def read_gpx_points_gpxpy(gpxfile: str) -> dict[str, np.ndarray]:
+    # Only imported for the rare files that need it
+    import gpxpy
+
+    with io.TextIOWrapper(open_source(gpxfile), encoding="utf-8") as f:
+        activity = gpxpy.parse(f)
 
     lon = []
     lat = []
     ele = []
     time = []
-    name = []
-    dist = []
+    segment_starts = []
 
     for activity_track in activity.tracks:
         for segment in activity_track.segments:
             if not segment.points:
                 continue
 
-            x0 = segment.points[0].longitude
-            y0 = segment.points[0].latitude
-            d0 = 0
+            segment_starts.append(len(lon))
             for point in segment.points:
-                x = point.longitude
-                y = point.latitude
-                z = point.elevation
-                t = point.time
-                lon.append(x)
-                lat.append(y)
-                ele.append(z)
-                time.append(t)
-                name.append(gpxfile)
-                d = d0 + math.sqrt(math.pow(x - x0, 2) + math.pow(y - y0, 2))
-                dist.append(d)
-                x0 = x
-                y0 = y
-                d0 = d
+                lon.append(point.longitude)
+                lat.append(point.latitude)
+                ele.append(point.elevation)
+                time.append(point.time)
+
+    return {
+        "lon": np.array(lon, dtype="float64"),
+        "lat": np.array(lat, dtype="float64"),
+        "ele": np.array(ele, dtype="float64"),
+        "time": pd.to_datetime(time, utc=True).as_unit("ns").asi8,
+        "segment_starts": segment_starts,
+    }
+
+
+# Function for processing an individual FIT file
+def process_fit(fitfile: str, distance: str = "planar") -> pd.DataFrame:
+    try:
+        points = read_fit_points(fitfile)
+    except UnsupportedFIT:
+        points = read_fit_points_fitdecode(fitfile)
 
     df = pd.DataFrame(
-        list(zip(lon, lat, ele, time, name, dist)),
+        {
+            "lon": points["lon"],
+            "lat": points["lat"],
+            "ele": points["ele"],
+            "time": pd.to_datetime(points["time"], utc=True, unit="ns"),
+            "name": fitfile,
+            "dist": segment_distances(points["lon"], points["lat"], None, distance),
+        },
         columns=["lon", "lat", "ele", "time", "name", "dist"],
     )
 
     return df
 
 
-# Function for processing an individual FIT file
-# Ref: https://github.com/dodo-saba/fit2gpx
-def process_fit(fitfile: str) -> pd.DataFrame:
-    conv = fit2gpx.Converter()
-    df_lap, df = conv.fit_to_dataframes(fname=fitfile)
+# Fallback for files the native decoder can't handle, using the same rules as
+# fit2gpx: only records with a position, without decoding laps
+# Ref: https://github.com/polyvertex/fitdecode
+def read_fit_points_fitdecode(fitfile: str) -> dict[str, np.ndarray]:
+    # Only imported for the rare files that need it
+    import fitdecode
 
-    df["name"] = fitfile
+    lon = []
+    lat = []
+    ele = []
+    time = []
 
-    dist = []
+    with open_source(fitfile) as f, fitdecode.FitReader(f) as fit:
+        for frame in fit:
+            if not isinstance(frame, fitdecode.FitDataMessage):
+                continue
+            if frame.name != "record":
+                continue
+            x = frame.get_value("position_long", fallback=None)
+            y = frame.get_value("position_lat", fallback=None)
+            if x is None or y is None:
+                continue
+            z = frame.get_value("altitude", fallback=None)
+            if z is None:
+                z = frame.get_value("enhanced_altitude", fallback=None)
+            t = frame.get_value("timestamp", fallback=None)
+            lon.append(x / SEMICIRCLES)
+            lat.append(y / SEMICIRCLES)
+            ele.append(z)
+            time.append(t if isinstance(t, datetime) else None)
+
+    return {
+        "lon": np.array(lon, dtype="float64"),
+        "lat": np.array(lat, dtype="float64"),
+        "ele": np.array(ele, dtype="float64"),
+        "time": pd.to_datetime(time, utc=True).as_unit("ns").asi8,
+    }
+
+
+def _alarm(signum, frame):
+    raise FileTimeout
+
+
+@contextmanager
+def _budget(timeout: float, memory: int):
+    # Raise FileTimeout after timeout seconds, and MemoryError on allocating
+    # more than memory bytes, within the body. Enforced where the platform
+    # allows: the timeout needs SIGALRM (not on Windows), the memory limit
+    # needs RLIMIT_AS and /proc (Linux). Only used in worker processes.
+    if timeout and hasattr(signal, "setitimer"):
+        handler = signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    limits = None
+    if memory:
+        try:
+            import resource
+
+            with open("/proc/self/statm") as f:
+                used = int(f.read().split()[0]) * resource.getpagesize()
+            limits = resource.getrlimit(resource.RLIMIT_AS)
+            limit = used + memory
+            if limits[1] != resource.RLIM_INFINITY:
+                limit = min(limit, limits[1])
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limits[1]))
+        except (ImportError, OSError, ValueError):
+            limits = None
+    try:
+        yield
+    finally:
+        if timeout and hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, handler)
+        if limits is not None:
+            resource.setrlimit(resource.RLIMIT_AS, limits)
 
-    for i in range(len(df.index)):
-        if i < 1:
-            x0 = df["longitude"][0]
-            y0 = df["latitude"][0]
-            d0 = 0
-            dist.append(d0)
+
+def _process_batch(
+    batch: tuple[list[str], list[bytes | None] | None],
+    distance: str = "planar",
+    timeout: float = FILE_TIMEOUT,
+    memory: int = FILE_MEMORY,
+) -> tuple[
+    list[str],
+    np.ndarray,
+    dict[str, np.ndarray],
+    list[str | None],
+    np.ndarray,
+    np.ndarray,
+    int,
+]:
+    # Parse a batch of files in a worker, from their contents if already read.
+    # The points of all files are returned as one set of typed columns, with
+    # the number of points per file (-1 for failures), so results cross the
+    # process boundary as a few flat arrays. A file that fails to parse, or
+    # goes over its time or memory budget, only fails itself: the reason is
+    # returned for it, and whether it is worth retrying. Also returns the start
+    # time and duration of each parse, and the worker pid.
+    fpaths, contents = batch
+    lengths = np.full(len(fpaths), -1, dtype="int64")
+    errors = [None] * len(fpaths)
+    retry = np.zeros(len(fpaths), dtype=bool)
+    timings = np.zeros((len(fpaths), 2))
+    parts = {col: [] for col in COLUMNS}
+    for i, fpath in enumerate(fpaths):
+        timings[i, 0] = time.time()
+        start = time.perf_counter()
+        try:
+            with _budget(timeout, memory):
+                if contents is None or contents[i] is None:
+                    df = process_file(fpath, distance)
+                else:
+                    with prefetched(fpath, contents[i]):
+                        df = process_file(fpath, distance)
+                columns = to_columns(df)
+        except FileTimeout:
+            errors[i] = f"Took longer than {timeout:g} s"
+            retry[i] = True
+        except MemoryError:
+            errors[i] = f"Used more than {memory / 1024**2:.0f} MB"
+        except Exception as e:
+            errors[i] = f"{type(e).__name__}: {e}"
+            retry[i] = isinstance(e, RETRIED_ERRORS)
         else:
-            x = df["longitude"][i]
-            y = df["latitude"][i]
-            d = d0 + math.sqrt(math.pow(x - x0, 2) + math.pow(y - y0, 2))
-            dist.append(d)
-            x0 = x
-            y0 = y
-            d0 = d
-
-    df = df.join(pd.DataFrame({"dist": dist}))
-    df = df[["longitude", "latitude", "altitude", "timestamp", "name", "dist"]]
-    df = df.rename(
-        columns={
-            "longitude": "lon",
-            "latitude": "lat",
-            "altitude": "ele",
-            "timestamp": "time",
-        }
+            lengths[i] = len(columns["time"])
+            for col, values in columns.items():
+                parts[col].append(values)
+        timings[i, 1] = time.perf_counter() - start
+
+    columns = {
+        col: np.concatenate(values) if values else np.empty(0, dtype=COLUMNS[col])
+        for col, values in parts.items()
+    }
+    return fpaths, lengths, columns, errors, retry, timings, os.getpid()
+
+
+# Parse (unzipped) GPX and FIT files into a columnar track store, reusing the
+# per-file cache for unchanged files. Files are parsed in batches of chunksize
+# by a pool of processes workers (by default, sized to the number of files),
+# with readers threads reading the files ahead of them.
+# Unchanged files found in a base store, such as the one from the previous run
+# of a watch, are copied from it without reading the per-file cache.
+# Files that fail to parse, or take longer than timeout seconds or more than
+# memory bytes, are quarantined: skipped until they change, or retry_failed.
+def load_tracks(
+    filenames: list[str],
+    distance: str = "planar",
+    processes: int | None = None,
+    chunksize: int | None = None,
+    base: TrackStore | None = None,
+    readers: int = READERS,
+    timeout: float = FILE_TIMEOUT,
+    memory: int = FILE_MEMORY,
+    retry_failed: bool = False,
+) -> TrackStore:
+    # Only GPX and FIT files are parsed; other files, such as activities.csv
+    # matched by a glob, are skipped
+    unsupported = [fpath for fpath in filenames if not track_format(fpath)]
+    filenames = [fpath for fpath in filenames if track_format(fpath)]
+
+    # Reuse the assembled store if no input file has changed
+    with profiler.stage("open track store") as counts:
+        keys = {fpath: file_key(fpath, distance) for fpath in filenames}
+        store_path = store_dir(keys)
+        try:
+            store = None if retry_failed else TrackStore(store_path)
+        except (FileNotFoundError, ValueError):
+            store = None
+        if store is not None:
+            os.utime(store_path)
+            print(f"Loaded {len(store)} cached activities")
+            counts.update(activities=len(store), points=store.n_points)
+            return store
+
+    # Load unchanged files from the cache, only parse new or modified ones
+    with profiler.stage("read file cache") as counts:
+        cache = TrackCache()
+        tracks = {}
+        quarantined = {}
+        if base is not None and base.keys is not None:
+            for i, (fpath, key) in enumerate(zip(base.names, base.keys)):
+                if keys.get(fpath) == key:
+                    tracks[fpath] = base.track(i)
+        for fpath in filenames:
+            if fpath in tracks:
+                continue
+            reason = cache.failure(fpath, keys[fpath])
+            if reason is not None and not retry_failed:
+                tracks[fpath] = None
+                quarantined[fpath] = reason
+                continue
+            found, df = cache.get(keys[fpath])
+            if found and df is None and not retry_failed:
+                # Failed before failures were quarantined
+                tracks[fpath] = None
+                quarantined[fpath] = "Failed"
+            elif found and df is not None:
+                tracks[fpath] = df
+        missing = [fpath for fpath in filenames if fpath not in tracks]
+        print(
+            f"Loaded {len(tracks) - len(quarantined)} cached files, "
+            f"processing {len(missing)}"
+        )
+        counts["activities"] = len(tracks) - len(quarantined)
+
+    with profiler.stage("parse files", activities=len(missing), points=0) as counts:
+        failures = _parse_files(
+            missing,
+            keys,
+            tracks,
+            cache,
+            distance,
+            processes,
+            chunksize,
+            readers,
+            timeout,
+            memory,
+        )
+        counts["points"] = sum(len(tracks[f]["time"]) for f in missing if tracks[f])
+
+    with profiler.stage("prune file cache"):
+        cache.prune()
+
+    # Skip failed and empty files
+    processed = [(fpath, tracks[fpath]) for fpath in filenames]
+    processed = [(f, c) for f, c in processed if c is not None and len(c["time"])]
+
+    with profiler.stage("write track store", activities=len(processed)) as counts:
+        store = TrackStore.write(
+            store_path, processed, [keys[fpath] for fpath, _ in processed]
+        )
+        prune_stores()
+        counts["points"] = store.n_points
+
+    _report(store, tracks, unsupported, quarantined, failures)
+    return store
+
+
+def _report(
+    store: TrackStore,
+    tracks: dict,
+    unsupported: list[str],
+    quarantined: dict[str, str],
+    failures: dict[str, str],
+) -> None:
+    # Summarise what was ingested, skipped and failed, listing new failures
+    empty = sum(1 for c in tracks.values() if c is not None and not len(c["time"]))
+    print(
+        f"Ingested {len(store)} files ({store.n_points:,} points), "
+        f"skipped {empty} empty, {len(unsupported)} unsupported and "
+        f"{len(quarantined)} quarantined, "
+        f"{len(failures)} failed"
     )
+    for fpath, reason in list(failures.items())[:LISTED_FAILURES]:
+        print(f"  {fpath}: {reason}")
+    if len(failures) > LISTED_FAILURES:
+        print(f"  and {len(failures) - LISTED_FAILURES} more")
+    if failures or quarantined:
+        print("Failed files are quarantined until they change (see --retry_failed)")
 
-    return df
 
+def _parse_files(
+    missing: list[str],
+    keys: dict[str, str],
+    tracks: dict,
+    cache: TrackCache,
+    distance: str,
+    processes: int | None,
+    chunksize: int | None,
+    readers: int = READERS,
+    timeout: float = FILE_TIMEOUT,
+    memory: int = FILE_MEMORY,
+) -> dict[str, str]:
+    # Parse files in a process pool into tracks, caching each result, and
+    # return why each failed file failed
+    failures = {}
+    if not missing:
+        return failures
 
-def load_cache(filenames: list[str]) -> tuple[Path, pd.DataFrame | None]:
-    # Create a cache key from the filenames
-    key = hashlib.md5("".join(filenames).encode("utf-8")).hexdigest()
+    retries = []
 
-    # Create a cache directory
-    dir_name = Path(tempfile.gettempdir()) / "stravavis"
-    dir_name.mkdir(parents=True, exist_ok=True)
-    cache_filename = dir_name / f"cached_activities_{key}.pkl"
-    print(f"Cache filename: {cache_filename}")
+    def add(result, retried=False):
+        fpaths, lengths, columns, errors, retry, timings, pid = result
+        # Views into the batch, copied once when writing the store
+        stops = np.cumsum(np.maximum(lengths, 0))
+        starts = stops - np.maximum(lengths, 0)
+        for i, fpath in enumerate(fpaths):
+            n, start, stop = lengths[i], starts[i], stops[i]
+            profiler.add_file(fpath, int(n), *timings[i], pid)
+            parsed = None
+            if n >= 0:
+                parsed = {col: values[start:stop] for col, values in columns.items()}
+            elif retry[i] and not retried:
+                retries.append(fpath)
+                continue
+            else:
+                failures[fpath] = errors[i]
+            tracks[fpath] = parsed
+            cache.put(fpath, keys[fpath], parsed, errors[i])
 
-    # Load cache if it exists
-    try:
-        df = pd.read_pickle(cache_filename)
-        print("Loaded cached activities")
-        return cache_filename, df
-    except FileNotFoundError:
-        print("Cache not found")
-        return cache_filename, None
+    workers = processes or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, min(64, len(missing) // (4 * workers)))
+    batches = [missing[i : i + chunksize] for i in range(0, len(missing), chunksize)]
+    parse = partial(_process_batch, distance=distance, timeout=timeout, memory=memory)
+    lost = []
+    results = _parse_batches(
+        batches, parse, processes, readers, READ_AHEAD * workers, lost
+    )
+    for result in track(results, total=len(batches), description="Processing"):
+        add(result)
 
+    # A worker died (killed for running out of memory, or crashed in a parser),
+    # taking down the batches in flight. Parse their files again one at a time,
+    # so only the file that kills its worker fails.
+    if lost:
+        print(f"A parsing process died, parsing {len(lost)} files one at a time")
+        died = []
+        for result in _parse_batches([[f] for f in lost], parse, 1, 0, 1, died):
+            add(result)
+        for fpath in died:
+            failures[fpath] = "Parsing process died"
+            tracks[fpath] = None
+            cache.put(fpath, keys[fpath], None, failures[fpath])
+
+    # Read and decompression errors and timeouts may have been caused by other
+    # work at the time: give those files a second chance, on their own
+    if retries:
+        print(f"Parsing {len(retries)} files again one at a time")
+        died = []
+        for result in _parse_batches([[f] for f in retries], parse, 1, 0, 1, died):
+            add(result, retried=True)
+        for fpath in died:
+            failures[fpath] = "Parsing process died"
+            tracks[fpath] = None
+            cache.put(fpath, keys[fpath], None, failures[fpath])
+    return failures
 
-# Function for processing (unzipped) GPX and FIT files in a directory (path)
-def process_data(filenames: list[str]) -> pd.DataFrame:
-    # Process all files (GPX or FIT)
-    cache_filename, df = load_cache(filenames)
-    if df is not None:
-        return df
 
-    with Pool() as pool:
+def _parse_batches(
+    batches: list[list[str]],
+    parse,
+    processes: int | None,
+    readers: int,
+    window: int,
+    lost: list[str],
+):
+    # Yield parse((fpaths, contents)) for each batch, computed in a process pool
+    # with at most window batches in flight, while readers threads read the
+    # files of the next batches, up to READ_AHEAD_BYTES not yet parsed. If a
+    # worker dies, the files of the batches in flight are added to lost and the
+    # pool is restarted for the rest.
+    batches = deque(batches)
+    reading = deque()
+    running = {}
+    pool = None
+    # Bytes read, or being read, and not yet parsed
+    held = 0
+    sizes = {}
+    if readers:
+        sizes = {fpath: _source_size(fpath) for fpaths in batches for fpath in fpaths}
+    with ThreadPoolExecutor(max(readers, 1)) as executor:
         try:
-            it = pool.imap_unordered(process_file, filenames)
-            it = track(it, total=len(filenames), description="Processing")
-            processed = list(it)
+            while batches or reading or running:
+                if pool is None:
+                    pool = ProcessPoolExecutor(processes)
+
+                # Read ahead of the workers
+                while batches and len(reading) < window:
+                    fpaths = batches.popleft()
+                    if not readers:
+                        reading.append((fpaths, None, 0))
+                        continue
+                    # Split off the files that fit in the budget, or at least
+                    # one file if nothing else is held
+                    n = 0
+                    size = 0
+                    while n < len(fpaths):
+                        if held + size and (
+                            held + size + sizes[fpaths[n]] > READ_AHEAD_BYTES
+                        ):
+                            break
+                        size += sizes[fpaths[n]]
+                        n += 1
+                    if n < len(fpaths):
+                        batches.appendleft(fpaths[n:])
+                    if not n:
+                        break
+                    fpaths = fpaths[:n]
+                    futures = [executor.submit(_read, f) for f in fpaths]
+                    reading.append((fpaths, futures, size))
+                    held += size
+
+                # Hand batches over to the workers in order, once read
+                while reading and len(running) < window and _ready(reading[0][1]):
+                    fpaths, futures, size = reading.popleft()
+                    batch = (fpaths, _contents(futures))
+                    running[pool.submit(parse, batch)] = (fpaths, size)
+
+                waiting = set(running)
+                if reading and len(running) < window:
+                    waiting.update(reading[0][1] or ())
+                done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+
+                broken = False
+                for future in done:
+                    if future not in running:
+                        continue
+                    fpaths, size = running.pop(future)
+                    held -= size
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        lost.extend(fpaths)
+                        broken = True
+                    else:
+                        yield result
+                if broken:
+                    # Every batch in flight is lost along with the pool
+                    for future, (fpaths, size) in running.items():
+                        held -= size
+                        if future.exception() is None:
+                            yield future.result()
+                        else:
+                            lost.extend(fpaths)
+                    running.clear()
+                    pool.shutdown()
+                    pool = None
         finally:
-            pool.close()
-            pool.join()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
 
-    df = pd.concat(processed)
 
-    df["time"] = pd.to_datetime(df["time"], utc=True)
+def _read(fpath: str) -> bytes | None:
+    try:
+        return read_source(fpath)
+    except Exception:
+        # Left to the worker to read, and fail on
+        return None
 
-    # Save cache
-    df.to_pickle(cache_filename)
 
-    return df
+def _source_size(fpath: str) -> int:
+    try:
+        return source_size(fpath)
+    except (OSError, KeyError):
+        # Left to the worker to fail on
+        return 0
+
+
+def _ready(futures: list | None) -> bool:
+    return futures is None or all(future.done() for future in futures)
+
+
+def _contents(futures: list | None) -> list[bytes | None] | None:
+    if futures is None:
+        return None
+    return [future.result() for future in futures]
+
+
+# Function for processing (unzipped) GPX and FIT files in a directory (path)
+def process_data(
+    filenames: list[str],
+    columns: list[str] | None = None,
+    distance: str = "planar",
+    processes: int | None = None,
+    chunksize: int | None = None,
+    readers: int = READERS,
+) -> pd.DataFrame:
+    return load_tracks(filenames, distance, processes, chunksize, readers=readers).read(
+        columns
+    )
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Slowest files listed in the profile summary
+SLOWEST_FILES = 10
+
+
+def peak_rss_mb() -> float | None:
+    # Peak resident memory so far of this process and its finished children
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def _cpu_time() -> float:
+    # CPU time of this process and its finished children
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Profiler:
+    # Records the wall and CPU time, peak memory and amount of data of each stage
+    # of a run, and the parse time of each file. Does nothing until enabled.
+
+    def __init__(self):
+        self.enabled = False
+        self.stages: list[dict] = []
+        self.files: list[dict] = []
+
+    @contextmanager
+    def stage(self, name: str, **counts):
+        # Time the body as a stage. Counts such as activities and points can be
+        # passed in or set on the yielded dict.
+        if not self.enabled:
+            yield counts
+            return
+
+        start = time.time()
+        wall = time.perf_counter()
+        cpu = _cpu_time()
+        try:
+            yield counts
+        finally:
+            self.stages.append(
+                {
+                    "name": name,
+                    "start": start,
+                    "wall": time.perf_counter() - wall,
+                    "cpu": _cpu_time() - cpu,
+                    "peak_rss_mb": peak_rss_mb(),
+                    "pid": os.getpid(),
+                    **counts,
+                }
+            )
+
+    def add_file(
+        self, fpath: str, points: int, start: float, seconds: float, pid: int
+    ) -> None:
+        if self.enabled:
+            self.files.append(
+                {
+                    "file": fpath,
+                    "points": points,
+                    "start": start,
+                    "wall": seconds,
+                    "pid": pid,
+                }
+            )
+
+    def summary(self) -> None:
+        from rich.console import Console
+        from rich.table import Table
+
+        def mb(value):
+            return "" if value is None else f"{value:.0f}"
+
+        table = Table(title="Profile")
+        table.add_column("Stage")
+        for column in ("Wall s", "CPU s", "Peak RSS MB", "Activities", "Points"):
+            table.add_column(column, justify="right")
+        for stage in self.stages:
+            table.add_row(
+                stage["name"],
+                f"{stage['wall']:.3f}",
+                f"{stage['cpu']:.3f}",
+                mb(stage["peak_rss_mb"]),
+                str(stage.get("activities", "")),
+                str(stage.get("points", "")),
+            )
+
+        console = Console()
+        console.print(table)
+
+        if self.files:
+            slowest = sorted(self.files, key=lambda f: f["wall"], reverse=True)
+            table = Table(title=f"Slowest of {len(self.files)} parsed files")
+            table.add_column("File")
+            table.add_column("Wall s", justify="right")
+            table.add_column("Points", justify="right")
+            for file in slowest[:SLOWEST_FILES]:
+                table.add_row(file["file"], f"{file['wall']:.3f}", str(file["points"]))
+            console.print(table)
+
+    def save(self, path: str) -> None:
+        # Chrome trace events (chrome://tracing, Perfetto), one lane per process,
+        # with the raw records under otherData
+        origin = min((event["start"] for event in self.stages + self.files), default=0)
+
+        def trace_event(name, category, event, args):
+            return {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (event["start"] - origin) * 1e6,
+                "dur": event["wall"] * 1e6,
+                "pid": event["pid"],
+                "tid": 0 if category == "stage" else 1,
+                "args": args,
+            }
+
+        events = [
+            trace_event(
+                stage["name"],
+                "stage",
+                stage,
+                {
+                    key: value
+                    for key, value in stage.items()
+                    if key not in ("name", "start", "wall", "pid")
+                },
+            )
+            for stage in self.stages
+        ]
+        events += [
+            trace_event(
+                os.path.basename(file["file"]),
+                "file",
+                file,
+                {"file": file["file"], "points": file["points"]},
+            )
+            for file in self.files
+        ]
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "traceEvents": events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"stages": self.stages, "files": self.files},
+                },
+                f,
+                indent=1,
+            )
+
+
+# Shared by every stage of a run
+profiler = Profiler()
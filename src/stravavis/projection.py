@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import numpy as np
+
+# Dummy units
+MAP_WIDTH = 1
+MAP_HEIGHT = 1
+
+
+def convert_x(lon):
+    # Get x value
+    x = (lon + 180) * (MAP_WIDTH / 360)
+    return x
+
+
+def convert_y(lat):
+    # Convert from degrees to radians
+    lat_rad = lat * np.pi / 180
+
+    # Get y value
+    mercator_n = np.log(np.tan((np.pi / 4) + (lat_rad / 2)))
+    y = (MAP_HEIGHT / 2) + (MAP_WIDTH * mercator_n / (2 * np.pi))
+    return y
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+# Upper bound on line samples held in memory at once while rasterising
+CHUNK_SAMPLES = 2**24
+
+TONE_MAPS = ("log", "equalize")
+
+
+def fit_extent(
+    x: np.ndarray, y: np.ndarray, shape: tuple[int, int], margin: float = 0.05
+) -> tuple[float, float, float, float]:
+    # Data extent (x0, x1, y0, y1) covering all points with equal aspect, centred
+    # in an image of the given (height, width) with a margin on every side
+    height, width = shape
+    x0, x1 = np.nanmin(x), np.nanmax(x)
+    y0, y1 = np.nanmin(y), np.nanmax(y)
+    units_per_px = max(
+        (x1 - x0) / (width * (1 - 2 * margin)),
+        (y1 - y0) / (height * (1 - 2 * margin)),
+        1e-12,
+    )
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    half_w = width * units_per_px / 2
+    half_h = height * units_per_px / 2
+    return cx - half_w, cx + half_w, cy - half_h, cy + half_h
+
+
+def segment_starts(x: np.ndarray, y: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    # Index of the first point of every segment, where segments join consecutive
+    # points of the same track, skipping gaps
+    valid = ~(np.isnan(x) | np.isnan(y))
+    seg = np.flatnonzero(valid[:-1] & valid[1:])
+    track_ends = offsets[1:-1] - 1
+    return seg[~np.isin(seg, track_ends)]
+
+
+def rasterize(
+    x: np.ndarray,
+    y: np.ndarray,
+    offsets: np.ndarray,
+    extent: tuple[float, float, float, float],
+    shape: tuple[int, int],
+) -> np.ndarray:
+    # Accumulate line density of every track into a (height, width) grid.
+    # Each segment is sampled at most one pixel apart, so every pixel a track
+    # passes through gets a count proportional to the track length inside it.
+    height, width = shape
+    x0, x1, y0, y1 = extent
+    px = (np.asarray(x, dtype="float64") - x0) * (width / (x1 - x0))
+    py = (y1 - np.asarray(y, dtype="float64")) * (height / (y1 - y0))
+
+    seg = segment_starts(px, py, offsets)
+
+    # Lone points (track ends and points between gaps) are drawn as dots
+    ends = ~(np.isnan(px) | np.isnan(py))
+    ends[seg] = False
+
+    grid = np.zeros(height * width, dtype="float64")
+    _draw_segments(grid, px[seg], py[seg], px[seg + 1], py[seg + 1], shape)
+    _accumulate(grid, px[ends], py[ends], shape)
+    return grid.reshape(shape)
+
+
+def rasterize_segments(
+    ax: np.ndarray,
+    ay: np.ndarray,
+    bx: np.ndarray,
+    by: np.ndarray,
+    extent: tuple[float, float, float, float],
+    shape: tuple[int, int],
+) -> np.ndarray:
+    # Line density of separate segments from (ax, ay) to (bx, by)
+    height, width = shape
+    x0, x1, y0, y1 = extent
+    sx, sy = width / (x1 - x0), height / (y1 - y0)
+    grid = np.zeros(height * width, dtype="float64")
+    _draw_segments(
+        grid, (ax - x0) * sx, (y1 - ay) * sy, (bx - x0) * sx, (y1 - by) * sy, shape
+    )
+    return grid.reshape(shape)
+
+
+def _clip(p: np.ndarray, d: np.ndarray, size: int, t0, t1) -> None:
+    # Narrow [t0, t1] to where p + t * d lies within [0, size] (Liang-Barsky)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ta = -p / d
+        tb = (size - p) / d
+    still = d == 0
+    outside = still & ((p < 0) | (p > size))
+    np.maximum(t0, np.where(still, 0, np.minimum(ta, tb)), out=t0)
+    np.minimum(t1, np.where(still, 1, np.maximum(ta, tb)), out=t1)
+    t1[outside] = -1
+
+
+def _draw_segments(grid, ax, ay, bx, by, shape) -> None:
+    # Sample each segment at most one pixel apart, excluding its end point.
+    # Segments are clipped to the image first, so long segments that only
+    # clip a corner stay cheap.
+    height, width = shape
+    dx, dy = bx - ax, by - ay
+    t0 = np.zeros(len(ax))
+    t1 = np.ones(len(ax))
+    _clip(ax, dx, width, t0, t1)
+    _clip(ay, dy, height, t0, t1)
+    visible = t1 > t0
+    ax, ay = (
+        ax[visible] + t0[visible] * dx[visible],
+        ay[visible] + t0[visible] * dy[visible],
+    )
+    span = t1[visible] - t0[visible]
+    dx, dy = dx[visible] * span, dy[visible] * span
+    samples = np.maximum(np.ceil(np.maximum(np.abs(dx), np.abs(dy))), 1).astype("int64")
+
+    # Bound memory by processing segments in chunks of samples
+    chunk = (np.cumsum(samples) - samples) // CHUNK_SAMPLES
+    bounds = np.append(np.flatnonzero(np.diff(chunk, prepend=-1)), len(samples))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        n = samples[start:stop]
+        first = np.cumsum(n) - n
+        owner = np.repeat(np.arange(len(n)), n)
+        t = (np.arange(n.sum()) - first[owner]) / n[owner]
+        sx = ax[start:stop][owner] + t * dx[start:stop][owner]
+        sy = ay[start:stop][owner] + t * dy[start:stop][owner]
+        _accumulate(grid, sx, sy, shape)
+
+
+def _accumulate(grid: np.ndarray, px: np.ndarray, py: np.ndarray, shape) -> None:
+    height, width = shape
+    col = np.floor(px).astype("int64")
+    row = np.floor(py).astype("int64")
+    inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+    flat = row[inside] * width + col[inside]
+    grid += np.bincount(flat, minlength=height * width)
+
+
+def _rasterize_chunk(args) -> np.ndarray:
+    return rasterize(*args)
+
+
+def rasterize_tracks(
+    x: np.ndarray,
+    y: np.ndarray,
+    offsets: np.ndarray,
+    extent: tuple[float, float, float, float],
+    shape: tuple[int, int],
+    processes: int | None = None,
+) -> np.ndarray:
+    # Rasterise in parallel by splitting whole activities across processes and
+    # summing their grids
+    if processes == 1 or len(x) < CHUNK_SAMPLES // 16:
+        return rasterize(x, y, offsets, extent, shape)
+
+    n_chunks = processes or os.cpu_count() or 1
+    cuts = np.unique(np.searchsorted(offsets, np.linspace(0, len(x), n_chunks + 1)))
+    with Pool(processes) as pool:
+        tasks = []
+        for a, b in zip(cuts[:-1], cuts[1:]):
+            if b > a:
+                start, stop = offsets[a], offsets[b]
+                tasks.append((x[start:stop], y[start:stop], offsets[a : b + 1] - start))
+        grid = np.zeros(shape)
+        for part in pool.imap_unordered(
+            _rasterize_chunk, [(*task, extent, shape) for task in tasks]
+        ):
+            grid += part
+    return grid
+
+
+def tone_map(
+    grid: np.ndarray, tone: str = "log", saturation: float | None = None
+) -> np.ndarray:
+    # Map densities to [0, 1] intensities. With log tone mapping, densities of
+    # saturation and above map to 1 (by default, the densest pixel)
+    if not grid.any():
+        return np.zeros_like(grid)
+    if tone == "log":
+        return np.minimum(np.log1p(grid) / np.log1p(saturation or grid.max()), 1)
+    if tone == "equalize":
+        # Histogram equalisation over the pixels that were drawn on
+        values, inverse, counts = np.unique(
+            grid, return_inverse=True, return_counts=True
+        )
+        cdf = np.cumsum(counts).astype("float64")
+        background = counts[0] if values[0] == 0 else 0
+        cdf = (cdf - background) / max(cdf[-1] - background, 1)
+        cdf[values == 0] = 0
+        return cdf[inverse].reshape(grid.shape)
+    msg = f"Unknown tone map {tone!r}, expected one of {TONE_MAPS}"
+    raise ValueError(msg)
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+# Points closer than this many output pixels to the simplified line are dropped
+PIXEL_TOLERANCE = 0.5
+
+
+def group_tracks(df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+    # Make the rows of each activity contiguous (keeping their order) and
+    # return the row offsets of each activity
+    codes, uniques = pd.factorize(df["name"])
+    if len(codes) and np.count_nonzero(np.diff(codes)) + 1 != len(uniques):
+        order = np.argsort(codes, kind="stable")
+        df = df.iloc[order]
+        codes = codes[order]
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    return df, np.append(starts, len(codes))
+
+
+def simplify(
+    x: np.ndarray,
+    y: np.ndarray,
+    offsets: np.ndarray,
+    tolerance: float = PIXEL_TOLERANCE,
+) -> np.ndarray:
+    # Ramer-Douglas-Peucker line simplification of every track at once.
+    #
+    # x and y should be in output pixel units; each track spans
+    # offsets[i]:offsets[i + 1]. Rather than recursing per track, each iteration
+    # finds the farthest point of every open range in a single vectorised pass,
+    # so the Python loop runs O(log n) times for typical tracks.
+    # Returns a boolean mask of the points to keep.
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    n = len(x)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+
+    # Always keep track ends and missing values with their neighbours, so gaps
+    # in the data are preserved; the ranges between them are simplified
+    missing = np.isnan(x) | np.isnan(y)
+    keep = missing.copy()
+    keep[1:] |= missing[:-1]
+    keep[:-1] |= missing[1:]
+    keep[offsets[:-1][offsets[:-1] < n]] = True
+    keep[offsets[1:] - 1] = True
+
+    breaks = np.flatnonzero(keep)
+    start = breaks[:-1]
+    end = breaks[1:]
+    same_track = np.searchsorted(offsets, start, side="right") == np.searchsorted(
+        offsets, end, side="right"
+    )
+    open_ranges = same_track & (end - start > 1)
+    start = start[open_ranges]
+    end = end[open_ranges]
+
+    while len(start):
+        # Interior points of every open range, and the range they belong to
+        counts = end - start - 1
+        first = np.cumsum(counts) - counts
+        rng = np.repeat(np.arange(len(start)), counts)
+        idx = np.arange(counts.sum()) - first[rng] + start[rng] + 1
+
+        # Perpendicular distance from each interior point to its range's chord
+        x0, y0 = x[start[rng]], y[start[rng]]
+        dx, dy = x[end[rng]] - x0, y[end[rng]] - y0
+        px, py = x[idx] - x0, y[idx] - y0
+        chord = np.hypot(dx, dy)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dist = np.where(
+                chord > 0, np.abs(dx * py - dy * px) / chord, np.hypot(px, py)
+            )
+
+        # Farthest point per range (first one on ties)
+        farthest = np.maximum.reduceat(dist, first)
+        is_max = dist == farthest[rng]
+        _, pos = np.unique(rng[is_max], return_index=True)
+        split_at = idx[np.flatnonzero(is_max)[pos]]
+
+        # Split ranges whose farthest point is out of tolerance
+        split = farthest > tolerance
+        split_at = split_at[split]
+        keep[split_at] = True
+        start = np.concatenate([start[split], split_at])
+        end = np.concatenate([split_at, end[split]])
+        open_ranges = end - start > 1
+        start = start[open_ranges]
+        end = end[open_ranges]
+
+    return keep
+
+
+def pixel_scale(
+    values: np.ndarray, offsets: np.ndarray | None, pixels: float
+) -> np.ndarray:
+    # Per-point factor mapping values to pixels when each track (or, without
+    # offsets, all tracks together) is scaled to span the given number of pixels
+    values = np.asarray(values, dtype="float64")
+    if offsets is None:
+        span = np.nanmax(values) - np.nanmin(values) if len(values) else 0
+        return np.full(len(values), pixels / span if span > 0 else 0.0)
+
+    counts = np.diff(offsets)
+    nonempty = counts > 0
+    lo = np.fmin.reduceat(values, offsets[:-1][nonempty])
+    hi = np.fmax.reduceat(values, offsets[:-1][nonempty])
+    span = hi - lo
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(span > 0, pixels / span, 0.0)
+    return np.repeat(scale, counts[nonempty])
+
+
+def simplify_mask(
+    x: np.ndarray,
+    y: np.ndarray,
+    offsets: np.ndarray,
+    store=None,
+    key: tuple = (),
+) -> np.ndarray:
+    # Keep mask for tracks in pixel coordinates, cached in the track store (if
+    # given) under a key describing the plot and its output size
+    if store is None:
+        return simplify(x, y, offsets)
+    return store.derived(("simplify", *key), lambda: simplify(x, y, offsets))
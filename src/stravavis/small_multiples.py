@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import math
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection
+
+from .dataset import as_dataset
+
+# Height (and width) of each facet in inches, as in seaborn.FacetGrid
+FACET_HEIGHT = 3
+
+# Space between facets as a fraction of their size, close to the tight layout
+# of a seaborn.FacetGrid without labels
+FACET_WSPACE = 0.2
+FACET_HSPACE = 0.25
+
+# Padding around the data in each facet, as matplotlib's axes.xmargin
+FACET_MARGIN = 0.05
+
+
+def normalize(values: np.ndarray, offsets: np.ndarray | None) -> np.ndarray:
+    # Scale each track (or, without offsets, all tracks together) into [0, 1]
+    # with a margin on both sides, as an autoscaled Axes would. Constant tracks
+    # are centred.
+    if offsets is None:
+        offsets = np.array([0, len(values)])
+    counts = np.diff(offsets)
+    nonempty = counts > 0
+    if not nonempty.any():
+        return values
+    lo = np.repeat(np.fmin.reduceat(values, offsets[:-1][nonempty]), counts[nonempty])
+    hi = np.repeat(np.fmax.reduceat(values, offsets[:-1][nonempty]), counts[nonempty])
+    span = hi - lo
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scaled = np.where(span > 0, (values - lo) / span, 0.5)
+    return (scaled + FACET_MARGIN) / (1 + 2 * FACET_MARGIN)
+
+
+def facet_grid(n: int) -> tuple[int, int]:
+    # Columns and rows of a near-square grid of n facets
+    ncol = max(math.ceil(math.sqrt(n)), 1)
+    nrow = max(math.ceil(n / ncol), 1)
+    return ncol, nrow
+
+
+def plot_small_multiples(
+    df,
+    x: str,
+    y: str,
+    output_file: str,
+    simplify: bool = True,
+    sharey: bool = False,
+    key: str = "facets",
+):
+    # Plot each activity in its own facet, ordered by start time.
+    #
+    # Facets are laid out and scaled like the Axes of a seaborn.FacetGrid, but
+    # all activities are drawn as one collection of lines in a single Axes, so
+    # the cost grows with the number of points rather than with an Axes per
+    # activity.
+
+    # Order facets by activity start time
+    data = as_dataset(df)
+    order = data.activity_index().sort_values("time")["name"]
+    ncol, nrow = facet_grid(len(order))
+
+    # Scale the points of each activity to their facet
+    offsets = data.offsets()
+    counts = np.diff(offsets)
+    cells = pd.Index(order).get_indexer(data.names())
+    xs = data.view(("normalized", x, False), lambda: normalize(data.column(x), offsets))
+    ys = data.view(
+        ("normalized", y, sharey),
+        lambda: normalize(data.column(y), None if sharey else offsets),
+    )
+
+    # Drop points that would fall on the same pixel of their facet
+    if simplify and len(xs):
+        cell = FACET_HEIGHT * plt.rcParams["figure.dpi"]
+        keep = data.simplified((key, cell), xs * cell, ys * cell, offsets)
+        xs = xs[keep]
+        ys = ys[keep]
+        offsets = np.searchsorted(np.flatnonzero(keep), offsets)
+        counts = np.diff(offsets)
+
+    # Facet size and position within the Axes, in inches
+    fig = plt.figure(figsize=(ncol * FACET_HEIGHT, nrow * FACET_HEIGHT))
+    ax = fig.add_axes((0.05, 0.05, 0.9, 0.9))
+    width = 0.9 * ncol * FACET_HEIGHT
+    height = 0.9 * nrow * FACET_HEIGHT
+    cell_w = width / (ncol + FACET_WSPACE * (ncol - 1))
+    cell_h = height / (nrow + FACET_HSPACE * (nrow - 1))
+    left = cells % ncol * cell_w * (1 + FACET_WSPACE)
+    bottom = height - cells // ncol * cell_h * (1 + FACET_HSPACE) - cell_h
+
+    # Plot all activities as a single collection of lines
+    px = np.repeat(left, counts) + xs * cell_w
+    py = np.repeat(bottom, counts) + ys * cell_h
+    tracks = np.split(np.column_stack([px, py]), offsets[1:-1])
+    lines = LineCollection(
+        tracks,
+        colors="black",
+        linewidths=4,
+        capstyle=plt.rcParams["lines.solid_capstyle"],
+        joinstyle=plt.rcParams["lines.solid_joinstyle"],
+    )
+    ax.add_collection(lines)
+    ax.set_xlim(0, width)
+    ax.set_ylim(0, height)
+
+    # Update plot aesthetics
+    ax.axis("off")
+    plt.savefig(output_file)
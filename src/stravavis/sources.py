@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import gzip
+import io
+import os
+import threading
+import zipfile
+from contextlib import contextmanager
+from typing import BinaryIO
+
+# Supported track formats, optionally gzipped as in the Strava bulk export
+TRACK_SUFFIXES = (".gpx", ".fit")
+
+# Open archives, reused for every member read by this process
+_archives: dict[str, zipfile.ZipFile] = {}
+_archives_lock = threading.Lock()
+
+# Contents of files already read by read_source, by name
+_prefetched: dict[str, bytes] = {}
+
+
+def _archive(path: str) -> zipfile.ZipFile:
+    try:
+        return _archives[path]
+    except KeyError:
+        # Members may be read from several threads at once
+        with _archives_lock:
+            if path not in _archives:
+                _archives[path] = zipfile.ZipFile(path)
+            return _archives[path]
+
+
+def _forget_archives() -> None:
+    # A forked process shares the file offset of inherited archives with its
+    # parent, so concurrent reads would corrupt each other: open them afresh
+    global _archives_lock
+    _archives.clear()
+    _archives_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_archives)
+
+
+def close_archives() -> None:
+    # Forget open archives, so changed ones are read afresh
+    for archive in _archives.values():
+        archive.close()
+    _archives.clear()
+
+
+def split_archive(name: str) -> tuple[str, str] | None:
+    # Split "export.zip/activities/1.gpx.gz" into the archive and member names,
+    # in the same way zipimport addresses files inside a zip
+    if os.path.exists(name):
+        return None
+    head = name
+    while True:
+        head, _ = os.path.split(head)
+        if not head or head == os.path.dirname(head):
+            return None
+        if head.lower().endswith(".zip") and os.path.isfile(head):
+            member = os.path.relpath(name, head).replace(os.sep, "/")
+            return head, member
+
+
+def track_format(name: str) -> str | None:
+    name = name.lower().removesuffix(".gz")
+    for suffix in TRACK_SUFFIXES:
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+def list_archive(path: str) -> list[str]:
+    # Names of track files inside a zip archive
+    return sorted(
+        os.path.join(path, *info.filename.split("/"))
+        for info in _archive(path).infolist()
+        if not info.is_dir() and track_format(info.filename)
+    )
+
+
+def source_exists(name: str) -> bool:
+    if os.path.exists(name):
+        return True
+    parts = split_archive(name)
+    if parts is None:
+        return False
+    archive, member = parts
+    try:
+        _archive(archive).getinfo(member)
+    except KeyError:
+        return False
+    return True
+
+
+def source_identity(name: str) -> str:
+    # A string that changes whenever the content of the source changes.
+    # Archive members are identified by their CRC, so a new export of the same
+    # activities reuses cached results.
+    parts = split_archive(name)
+    if parts is None:
+        stat = os.stat(name)
+        return f"{os.path.abspath(name)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    archive, member = parts
+    info = _archive(archive).getinfo(member)
+    return f"{member}\0{info.file_size}\0{info.CRC}"
+
+
+def source_size(name: str) -> int:
+    # Size of a file on disk or inside a zip archive, as returned by read_source
+    parts = split_archive(name)
+    if parts is None:
+        return os.path.getsize(name)
+    archive, member = parts
+    return _archive(archive).getinfo(member).file_size
+
+
+def read_source(name: str) -> bytes:
+    # Contents of a file on disk or inside a zip archive, still compressed if
+    # gzipped
+    parts = split_archive(name)
+    if parts is None:
+        with open(name, "rb") as f:
+            return f.read()
+    archive, member = parts
+    return _archive(archive).read(member)
+
+
+@contextmanager
+def prefetched(name: str, data: bytes):
+    # Have open_source read the file from its contents, as returned by
+    # read_source, instead of from disk
+    _prefetched[name] = data
+    try:
+        yield
+    finally:
+        del _prefetched[name]
+
+
+def open_source(name: str) -> BinaryIO:
+    # Open a file on disk or inside a zip archive, decompressing .gz on the fly
+    gz = name.lower().endswith(".gz")
+    if name in _prefetched:
+        f = io.BytesIO(_prefetched[name])
+        return gzip.GzipFile(fileobj=f, mode="rb") if gz else f
+    parts = split_archive(name)
+    if parts is None:
+        return gzip.open(name, "rb") if gz else open(name, "rb")
+    archive, member = parts
+    f = _archive(archive).open(member)
+    return gzip.GzipFile(fileobj=f, mode="rb") if gz else f
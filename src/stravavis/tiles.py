@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from multiprocessing import Pool
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from .raster import rasterize_segments, segment_starts, tone_map
+
+# Slippy map tiles, addressed as {zoom}/{x}/{y}.png like OpenStreetMap.
+# Track coordinates are expected from convert_x / convert_y, which map the
+# Web Mercator world onto the unit square.
+
+TILE_SIZE = 256
+# Line density (roughly, the number of passes along a route) drawn fully opaque,
+# fixed so that neighbouring tiles are shaded alike
+TILE_SATURATION = 16
+# Tiles rendered per task sent to a worker
+TILE_BATCH = 64
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Track coordinates shared by the tiles rendered in this process
+_tracks: tuple[np.ndarray, np.ndarray] | None = None
+
+
+def tile_index(
+    x: np.ndarray, y: np.ndarray, seg: np.ndarray, zoom: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Grid index of segments over the tiles at a zoom level. Each segment is
+    # listed under every tile its bounding box overlaps. Returns the tile
+    # columns and rows, and offsets into the segments listed per tile.
+    n = 2**zoom
+    tx0, tx1 = x[seg] * n, x[seg + 1] * n
+    ty0, ty1 = (1 - y[seg]) * n, (1 - y[seg + 1]) * n
+    col0 = np.clip(np.floor(np.minimum(tx0, tx1)), 0, n - 1).astype("int64")
+    col1 = np.clip(np.floor(np.maximum(tx0, tx1)), 0, n - 1).astype("int64")
+    row0 = np.clip(np.floor(np.minimum(ty0, ty1)), 0, n - 1).astype("int64")
+    row1 = np.clip(np.floor(np.maximum(ty0, ty1)), 0, n - 1).astype("int64")
+
+    # One entry per (segment, tile) pair
+    n_rows = row1 - row0 + 1
+    counts = (col1 - col0 + 1) * n_rows
+    owner = np.repeat(np.arange(len(seg)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    tile = (col0[owner] + k // n_rows[owner]) * n + row0[owner] + k % n_rows[owner]
+
+    order = np.argsort(tile, kind="stable")
+    tiles, starts = np.unique(tile[order], return_index=True)
+    return (
+        tiles // n,
+        tiles % n,
+        seg[owner[order]],
+        np.append(starts, len(order)),
+    )
+
+
+def _init_worker(x: np.ndarray, y: np.ndarray) -> None:
+    global _tracks
+    _tracks = (x, y)
+
+
+def _render_tiles(args) -> tuple[dict[str, list], int]:
+    # Render a batch of tiles, skipping those whose segments are unchanged
+    # since the previous run. Returns manifest entries (name -> [digest, drawn])
+    # and the number of tiles drawn.
+    output_dir, zoom, batch, previous = args
+    x, y = _tracks
+    n = 2**zoom
+    entries = {}
+    n_drawn = 0
+    for col, row, seg in batch:
+        name = f"{zoom}/{col}/{row}.png"
+        path = os.path.join(output_dir, name)
+        ax, ay, bx, by = x[seg], y[seg], x[seg + 1], y[seg + 1]
+        digest = hashlib.md5(
+            np.stack([ax, ay, bx, by]).tobytes()
+            + repr((MANIFEST_VERSION, TILE_SIZE, TILE_SATURATION)).encode()
+        ).hexdigest()
+        old = previous.get(name)
+        if (
+            old is not None
+            and old[0] == digest
+            and (not old[1] or os.path.exists(path))
+        ):
+            entries[name] = old
+            continue
+
+        extent = (col / n, (col + 1) / n, 1 - (row + 1) / n, 1 - row / n)
+        grid = rasterize_segments(ax, ay, bx, by, extent, (TILE_SIZE, TILE_SIZE))
+        drawn = bool(grid.any())
+        if drawn:
+            # Black lines on a transparent background, to overlay on a base map
+            rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4))
+            rgba[..., 3] = tone_map(grid, "log", TILE_SATURATION)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            plt.imsave(path, rgba)
+            n_drawn += 1
+        elif os.path.exists(path):
+            os.remove(path)
+        entries[name] = [digest, drawn]
+    return entries, n_drawn
+
+
+def render_tiles(
+    x: np.ndarray,
+    y: np.ndarray,
+    offsets: np.ndarray,
+    output_dir: str,
+    zoom_min: int = 0,
+    zoom_max: int = 14,
+    processes: int | None = None,
+) -> int:
+    # Render a pyramid of tiles over the zoom levels, only redrawing tiles whose
+    # contents changed since the last run. Returns the number of tiles drawn.
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        previous = manifest["tiles"] if manifest["version"] == MANIFEST_VERSION else {}
+    except (FileNotFoundError, ValueError, KeyError):
+        previous = {}
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    seg = segment_starts(x, y, offsets)
+
+    tasks = []
+    for zoom in range(zoom_min, zoom_max + 1):
+        cols, rows, tile_seg, bounds = tile_index(x, y, seg, zoom)
+        for first in range(0, len(cols), TILE_BATCH):
+            batch = [
+                (int(cols[i]), int(rows[i]), tile_seg[bounds[i] : bounds[i + 1]])
+                for i in range(first, min(first + TILE_BATCH, len(cols)))
+            ]
+            names = (f"{zoom}/{col}/{row}.png" for col, row, _ in batch)
+            old = {name: previous[name] for name in names if name in previous}
+            tasks.append((output_dir, zoom, batch, old))
+
+    tiles = {}
+    n_drawn = 0
+    if processes == 1 or len(tasks) <= 1:
+        _init_worker(x, y)
+        for entries, drawn in map(_render_tiles, tasks):
+            tiles.update(entries)
+            n_drawn += drawn
+    else:
+        with Pool(processes, _init_worker, (x, y)) as pool:
+            for entries, drawn in pool.imap_unordered(_render_tiles, tasks):
+                tiles.update(entries)
+                n_drawn += drawn
+
+    # Remove tiles that no longer have any tracks
+    for name, (_, drawn) in previous.items():
+        if name not in tiles and drawn:
+            path = os.path.join(output_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    os.makedirs(output_dir, exist_ok=True)
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "tiles": tiles}, f)
+    os.replace(tmp, manifest_path)
+
+    return n_drawn
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+STORE_VERSION = 4
+
+# Per-activity spatial summaries: bounding box, first and last points with
+# coordinates, and number of points without coordinates
+BOUNDS = ["lon_min", "lat_min", "lon_max", "lat_max"]
+ENDS = ["start_lon", "start_lat", "end_lon", "end_lat"]
+
+# Numeric per-point columns, each stored as its own .npy file
+COLUMNS = {
+    "lon": "float64",
+    "lat": "float64",
+    "ele": "float64",
+    "time": "datetime64[us]",
+    "dist": "float64",
+}
+
+
+class TrackStore:
+    # Columnar on-disk store of parsed tracks.
+    #
+    # Each point column is a separate .npy file that is memory-mapped on read, so
+    # plots only page in the columns they use. Activity names are kept once per
+    # activity alongside row offsets instead of once per point.
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            msg = f"Unsupported track store version in {self.path}"
+            raise ValueError(msg)
+        self.names = meta["names"]
+        # Cache key of each activity's source file, if known
+        self.keys = meta.get("keys")
+        self.offsets = np.load(self.path / "offsets.npy")
+        self._columns: dict[str, np.ndarray] = {}
+
+    def __reduce__(self):
+        # Other processes reopen the store by path instead of receiving a copy
+        return type(self), (self.path,)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def n_points(self) -> int:
+        return int(self.offsets[-1])
+
+    @property
+    def empty(self) -> bool:
+        return self.n_points == 0
+
+    @classmethod
+    def write(
+        cls,
+        path: str | Path,
+        tracks: list[tuple[str, dict[str, np.ndarray]]],
+        keys: list[str] | None = None,
+    ):
+        # Write tracks given as typed columns (see to_columns), with the cache
+        # key of each track's source file. Each column is copied straight into
+        # its memory-mapped file, without concatenating the tracks in memory
+        # first.
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        names = [name for name, _ in tracks]
+        lengths = [len(columns["time"]) for _, columns in tracks]
+        offsets = np.zeros(len(tracks) + 1, dtype="int64")
+        np.cumsum(lengths, out=offsets[1:])
+        np.save(tmp / "offsets.npy", offsets)
+
+        for col, dtype in COLUMNS.items():
+            if not offsets[-1]:
+                np.save(tmp / f"{col}.npy", np.empty(0, dtype=dtype))
+                continue
+            values = np.lib.format.open_memmap(
+                tmp / f"{col}.npy", mode="w+", dtype=dtype, shape=(int(offsets[-1]),)
+            )
+            for (_, columns), start, stop in zip(tracks, offsets[:-1], offsets[1:]):
+                values[start:stop] = columns[col]
+            values.flush()
+            del values
+
+        starts = np.array(
+            [_start_time(columns["time"]) for _, columns in tracks],
+            dtype=COLUMNS["time"],
+        )
+        np.save(tmp / "start.npy", starts)
+
+        # Spatial summaries, so queries can skip whole activities without
+        # reading their points
+        summaries = [_spatial_summary(columns) for _, columns in tracks]
+        bounds = np.array([b for b, _, _ in summaries], dtype="float64")
+        ends = np.array([e for _, e, _ in summaries], dtype="float64")
+        np.save(tmp / "bounds.npy", bounds.reshape(-1, len(BOUNDS)))
+        np.save(tmp / "ends.npy", ends.reshape(-1, len(ENDS)))
+        np.save(tmp / "gaps.npy", np.array([g for _, _, g in summaries], "int64"))
+
+        with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({"version": STORE_VERSION, "names": names, "keys": keys}, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return cls(path)
+
+    def column(self, col: str) -> np.ndarray:
+        if col not in self._columns:
+            self._columns[col] = np.load(self.path / f"{col}.npy", mmap_mode="r")
+        return self._columns[col]
+
+    def derived(self, key: tuple, compute) -> np.ndarray:
+        # Arrays derived from the tracks, cached next to them until the store is
+        # rewritten
+        digest = hashlib.md5(repr(key).encode("utf-8")).hexdigest()
+        path = self.path / "derived" / f"{digest}.npy"
+        try:
+            return np.load(path)
+        except (FileNotFoundError, ValueError):
+            pass
+        values = compute()
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(".tmp.npy")
+        np.save(tmp, values)
+        os.replace(tmp, path)
+        return values
+
+    def activities(self) -> pd.DataFrame:
+        # One row per activity: name, start time, row range in the columns and
+        # spatial summary
+        bounds = np.load(self.path / "bounds.npy")
+        ends = np.load(self.path / "ends.npy")
+        return pd.DataFrame(
+            {
+                "name": self.names,
+                "time": _to_utc(np.load(self.path / "start.npy")),
+                "start": self.offsets[:-1],
+                "stop": self.offsets[1:],
+                **dict(zip(BOUNDS, bounds.T)),
+                **dict(zip(ENDS, ends.T)),
+                "gaps": np.load(self.path / "gaps.npy"),
+            }
+        )
+
+    def select(
+        self, lon_min=None, lon_max=None, lat_min=None, lat_max=None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # Indices of the activities whose bounding box overlaps the given
+        # bounds, and whether all points of each are inside them, using only
+        # the per-activity summaries
+        bounds = np.load(self.path / "bounds.npy")
+        overlap = np.ones(len(self), dtype=bool)
+        inside = np.load(self.path / "gaps.npy") == 0
+        limits = (lon_min, lat_min, lon_max, lat_max)
+        if all(limit is None for limit in limits):
+            return np.arange(len(self)), np.ones(len(self), dtype=bool)
+
+        for i, limit in enumerate(limits):
+            if limit is None:
+                continue
+            # Minimum bounds are columns 0-1, maximum bounds columns 2-3
+            if i < 2:
+                overlap &= bounds[:, i + 2] >= limit
+                inside &= bounds[:, i] >= limit
+            else:
+                overlap &= bounds[:, i - 2] <= limit
+                inside &= bounds[:, i] <= limit
+        return np.flatnonzero(overlap), inside[overlap]
+
+    def track(self, i: int) -> dict[str, np.ndarray]:
+        # Memory-mapped columns of the activity at index i
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return {col: self.column(col)[start:stop] for col in COLUMNS}
+
+    def rows(
+        self, activities: np.ndarray | None = None
+    ) -> tuple[np.ndarray | None, np.ndarray]:
+        # Row indices of the activities at the given indices (None for all
+        # rows), and the offsets of each activity among those rows
+        if activities is None or len(activities) == len(self):
+            return None, self.offsets
+        activities = np.asarray(activities, dtype="int64")
+        starts = self.offsets[:-1][activities]
+        counts = self.offsets[1:][activities] - starts
+        offsets = np.zeros(len(activities) + 1, dtype="int64")
+        np.cumsum(counts, out=offsets[1:])
+        rows = np.arange(offsets[-1]) + np.repeat(starts - offsets[:-1], counts)
+        return rows, offsets
+
+    def read(
+        self, columns: list[str] | None = None, activities: np.ndarray | None = None
+    ) -> pd.DataFrame:
+        # Read the given columns of all activities, or only of the activities
+        # at the given indices, paging in just their rows
+        if columns is None:
+            columns = list(COLUMNS)
+
+        rows, offsets = self.rows(activities)
+        names = self.names
+        if rows is not None:
+            names = [self.names[i] for i in activities]
+
+        data = {}
+        for col in columns:
+            if col == "name":
+                continue
+            values = self.column(col)
+            if rows is not None:
+                values = values[rows]
+            data[col] = _to_utc(values) if col == "time" else values
+
+        # Activity names as a categorical built from the row offsets
+        codes = np.repeat(np.arange(len(names), dtype="int32"), np.diff(offsets))
+        data["name"] = pd.Categorical.from_codes(codes, categories=names)
+
+        return pd.DataFrame(data, copy=False)
+
+
+def to_columns(df: pd.DataFrame) -> dict[str, np.ndarray]:
+    # Typed point columns of one parsed track, as stored
+    return {col: _column(df, col, dtype) for col, dtype in COLUMNS.items()}
+
+
+def _column(df: pd.DataFrame, col: str, dtype: str) -> np.ndarray:
+    if col == "time":
+        time = pd.to_datetime(df["time"], utc=True).dt.tz_localize(None)
+        return time.to_numpy(dtype=dtype)
+    return pd.to_numeric(df[col]).to_numpy(dtype=dtype, na_value=np.nan)
+
+
+def _start_time(time: np.ndarray) -> np.datetime64:
+    # Earliest time of a track, skipping points without a time
+    time = time[~np.isnat(time)]
+    return time.min() if len(time) else np.datetime64("NaT")
+
+
+def _spatial_summary(
+    columns: dict[str, np.ndarray],
+) -> tuple[list[float], list[float], int]:
+    # Bounding box, first and last points with coordinates, and number of points
+    # without coordinates of one track
+    lon = columns["lon"]
+    lat = columns["lat"]
+    located = np.flatnonzero(~(np.isnan(lon) | np.isnan(lat)))
+    gaps = len(lon) - len(located)
+    if not len(located):
+        return [np.nan] * 4, [np.nan] * 4, gaps
+    lon = lon[located]
+    lat = lat[located]
+    first, last = located[0], located[-1]
+    return (
+        [lon.min(), lat.min(), lon.max(), lat.max()],
+        [
+            columns["lon"][first],
+            columns["lat"][first],
+            columns["lon"][last],
+            columns["lat"][last],
+        ],
+        gaps,
+    )
+
+
+def _to_utc(values: np.ndarray) -> pd.Series:
+    return pd.Series(values, copy=False).dt.tz_localize("UTC")